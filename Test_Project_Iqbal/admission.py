@@ -0,0 +1,314 @@
+# Kontrol penerimaan panggilan LLM: token bucket per pengguna dan per penyedia, serta antrean prioritas terbatas
+import asyncio
+import bisect
+import concurrent.futures
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Batas laju per pengguna: rata-rata per menit dan jumlah permintaan beruntun yang masih diterima
+USER_RATE_PER_MINUTE = float(os.getenv("ADMISSION_USER_RATE_PER_MINUTE", "6"))
+USER_BURST = int(os.getenv("ADMISSION_USER_BURST", "3"))
+# Kuota lokal per penyedia (permintaan per menit), mis. "telkom=120,gemini-flash=60,gemini-pro=30".
+# Penyedia yang tidak disebut tidak dibatasi.
+PROVIDER_RATES = os.getenv("ADMISSION_PROVIDER_RATES", "telkom=120,gemini-flash=60,gemini-pro=30")
+# Kapasitas bucket penyedia setara jatah sekian detik
+PROVIDER_BURST_SECONDS = float(os.getenv("ADMISSION_PROVIDER_BURST_SECONDS", "10"))
+
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "16"))
+MAX_CONCURRENT_PER_USER = int(os.getenv("MAX_CONCURRENT_PER_USER", "1"))
+MAX_QUEUE_LENGTH = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Permintaan yang menunggu lebih lama dari ini dibatalkan (detik)
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120"))
+# Selang pengecekan posisi antrean untuk umpan balik ke pengguna (detik)
+POSITION_POLL_SECONDS = 2.0
+# Selang pembersihan bucket pengguna yang sudah penuh kembali (detik)
+USER_BUCKET_PRUNE_SECONDS = 60.0
+
+# Angka kecil = didahulukan
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class TokenBucket:
+    """Token bucket sederhana yang aman dipakai dari beberapa thread."""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self):
+        """Mengambil satu token; 0 jika berhasil, atau detik sampai token berikutnya tersedia."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def is_full(self, now):
+        """True jika bucket sudah terisi penuh, sehingga sama saja dengan bucket baru."""
+        with self._lock:
+            return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+def parse_rates(text):
+    """'telkom=120,gemini-flash=60' -> {'telkom': 120.0, 'gemini-flash': 60.0}"""
+    rates = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            rates[name.strip()] = float(value)
+    return rates
+
+
+class ProviderLimiter:
+    """Kuota lokal per penyedia LLM agar lonjakan satu tim tidak menghabiskan kuota API untuk semua."""
+
+    def __init__(self, rates_per_minute=None, burst_seconds=PROVIDER_BURST_SECONDS):
+        rates = parse_rates(PROVIDER_RATES) if rates_per_minute is None else rates_per_minute
+        self.buckets = {
+            name: TokenBucket(rate / 60, rate / 60 * burst_seconds) for name, rate in rates.items()
+        }
+
+    def try_acquire(self, name):
+        """0 jika penyedia boleh dipanggil sekarang, atau detik sampai kuotanya tersedia lagi."""
+        bucket = self.buckets.get(name)
+        return bucket.try_take() if bucket is not None else 0.0
+
+    def acquire(self, name, timeout):
+        """Versi menunggu untuk pekerjaan latar belakang; False jika kuota tidak tersedia dalam `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(name)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class AdmissionRejected(Exception):
+    """Permintaan ditolak sebelum sampai ke penyedia; pesannya layak ditampilkan ke pengguna."""
+
+    def __init__(self, message, reason, retry_after=None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, user_id, priority, seq):
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = seq
+        self.state = "waiting"  # waiting -> granted -> done
+        self.future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Membatasi panggilan LLM yang berjalan bersamaan dengan antrean prioritas terbatas.
+
+    Setiap pengguna punya token bucket; permintaan di atas lajunya langsung ditolak dengan
+    perkiraan waktu coba lagi. Permintaan yang lolos menunggu slot di antrean (prioritas lalu
+    urutan datang). Saat antrean penuh, permintaan berprioritas paling rendah yang dikeluarkan.
+    `user_id=None` (pekerjaan batch) tidak terkena batas laju maupun batas per pengguna.
+    """
+
+    def __init__(
+        self,
+        max_concurrent=MAX_CONCURRENT_LLM_CALLS,
+        max_per_user=MAX_CONCURRENT_PER_USER,
+        max_queue=MAX_QUEUE_LENGTH,
+        user_rate_per_minute=USER_RATE_PER_MINUTE,
+        user_burst=USER_BURST,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self._user_buckets = {}
+        self._buckets_pruned_at = time.monotonic()
+        self._waiting = []  # terurut: (prioritas, urutan, tiket)
+        self._running = 0
+        self._running_by_user = defaultdict(int)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def request(self, user_id, priority=PRIORITY_INTERACTIVE):
+        """Mendaftarkan permintaan; tiket langsung `granted` jika ada slot, selain itu menunggu di antrean."""
+        if user_id is not None:
+            with self._lock:
+                self._prune_user_buckets()
+                bucket = self._user_buckets.get(user_id)
+                if bucket is None:
+                    bucket = self._user_buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+                wait = bucket.try_take()
+            if wait:
+                raise AdmissionRejected(
+                    f"Anda mengirim terlalu banyak permintaan. Silakan coba lagi dalam {math.ceil(wait)} detik.",
+                    "user_rate", wait,
+                )
+        with self._lock:
+            ticket = Ticket(user_id, priority, next(self._seq))
+            entry = (priority, ticket.seq, ticket)
+            if len(self._waiting) >= self.max_queue:
+                if self._waiting and self._waiting[-1][0] > priority:
+                    _, _, evicted = self._waiting.pop()
+                    self._finish_waiting(evicted, AdmissionRejected(
+                        "Antrean sedang penuh oleh permintaan yang lebih mendesak. Silakan coba lagi nanti.", "evicted",
+                    ))
+                else:
+                    raise AdmissionRejected(
+                        "ASKARINA sedang melayani banyak permintaan dan antrean penuh. Silakan coba lagi sebentar lagi.",
+                        "queue_full",
+                    )
+            bisect.insort(self._waiting, entry)
+            self._dispatch()
+        if ticket.state == "waiting":
+            logger.info(f"Permintaan {user_id} masuk antrean, posisi {self.position(ticket)} dari {len(self._waiting)}.")
+        return ticket
+
+    def _prune_user_buckets(self):
+        # Dipanggil dengan self._lock dipegang. Bucket penuh bisa dibuat ulang tanpa mengubah batas
+        # laju, jadi pengguna yang sudah diam tidak membuat dict ini tumbuh tanpa batas.
+        now = time.monotonic()
+        if now - self._buckets_pruned_at < USER_BUCKET_PRUNE_SECONDS:
+            return
+        self._buckets_pruned_at = now
+        for user_id in [user_id for user_id, bucket in self._user_buckets.items() if bucket.is_full(now)]:
+            del self._user_buckets[user_id]
+
+    def position(self, ticket):
+        """Posisi tiket di antrean (mulai dari 1), atau 0 jika sudah mendapat slot."""
+        with self._lock:
+            if ticket.state != "waiting":
+                return 0
+            return bisect.bisect_left(self._waiting, (ticket.priority, ticket.seq)) + 1
+
+    def queue_length(self):
+        with self._lock:
+            return len(self._waiting)
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.state != "granted":
+                return
+            ticket.state = "done"
+            self._running -= 1
+            if ticket.user_id is not None:
+                self._running_by_user[ticket.user_id] -= 1
+                if not self._running_by_user[ticket.user_id]:
+                    del self._running_by_user[ticket.user_id]
+            self._dispatch()
+
+    def cancel(self, ticket):
+        """Mengeluarkan tiket yang masih menunggu, atau melepas slotnya jika sudah diberikan."""
+        with self._lock:
+            if ticket.state == "waiting":
+                index = bisect.bisect_left(self._waiting, (ticket.priority, ticket.seq))
+                del self._waiting[index]
+                ticket.state = "done"
+                ticket.future.cancel()
+                return
+        self.release(ticket)
+
+    def _finish_waiting(self, ticket, error):
+        ticket.state = "done"
+        ticket.future.set_exception(error)
+
+    def _dispatch(self):
+        # Dipanggil dengan self._lock dipegang
+        index = 0
+        while index < len(self._waiting) and self._running < self.max_concurrent:
+            ticket = self._waiting[index][2]
+            if ticket.user_id is not None and self._running_by_user[ticket.user_id] >= self.max_per_user:
+                index += 1
+                continue
+            del self._waiting[index]
+            ticket.state = "granted"
+            self._running += 1
+            if ticket.user_id is not None:
+                self._running_by_user[ticket.user_id] += 1
+            ticket.future.set_result(True)
+
+    def _timed_out(self, ticket, timeout):
+        return timeout is not None and time.monotonic() - ticket.enqueued_at > timeout
+
+    def _timeout_error(self):
+        return AdmissionRejected("Antrean terlalu lama; permintaan dibatalkan. Silakan coba lagi.", "timeout")
+
+    @contextmanager
+    def acquire(self, user_id, priority=PRIORITY_INTERACTIVE, on_queued=None, timeout=QUEUE_TIMEOUT):
+        """Menunggu slot secara sinkron (Streamlit, thread pool). `on_queued(posisi)` dipanggil saat posisi berubah."""
+        ticket = self.request(user_id, priority)
+        try:
+            last_position = 0
+            while True:
+                position = self.position(ticket)
+                if position and position != last_position and on_queued is not None:
+                    on_queued(position)
+                last_position = position
+                try:
+                    ticket.future.result(timeout=POSITION_POLL_SECONDS)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if self._timed_out(ticket, timeout):
+                        raise self._timeout_error()
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aacquire(self, user_id, priority=PRIORITY_INTERACTIVE, on_queued=None, timeout=QUEUE_TIMEOUT):
+        """Versi async dari `acquire` untuk telegram_bot; `on_queued` berupa coroutine function."""
+        ticket = self.request(user_id, priority)
+        try:
+            granted = asyncio.wrap_future(ticket.future)
+            last_position = 0
+            while not granted.done():
+                position = self.position(ticket)
+                if position and position != last_position and on_queued is not None:
+                    await on_queued(position)
+                last_position = position
+                await asyncio.wait({granted}, timeout=POSITION_POLL_SECONDS)
+                if not granted.done() and self._timed_out(ticket, timeout):
+                    raise self._timeout_error()
+            granted.result()
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+
+_ADMISSION = AdmissionController()
+_PROVIDER_LIMITER = ProviderLimiter()
+
+
+def get_admission_controller():
+    return _ADMISSION
+
+
+def get_provider_limiter():
+    return _PROVIDER_LIMITER
@@ -0,0 +1,326 @@
+# Benchmark jalur pencarian database, ekstraksi PDF, dan penyusunan prompt (offline, tanpa panggilan LLM)
+#
+# Contoh:
+#   python benchmark.py                          # 1k, 10k, 100k baris + PDF 300 halaman
+#   python benchmark.py --rows 1000,1000000 --queries 500 --json hasil.json
+#   python benchmark.py --skip-pdf
+import argparse
+import json
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+
+import pandas as pd
+
+from chat_history import ChatHistoryManager
+from context_packer import estimate_tokens, question_with_context
+from database_cache import compact_dataframe, peak_rss_mb
+from database_search import build_search_index, find_relevant_context
+from knowledge_base import KnowledgeIndex
+from name_index import build_name_index
+from pdf_extract import count_pages, create_executor, extract_pdf_text
+from provider_router import ProviderRouter
+from structured_query import answer_structured_query, build_structured_index
+
+# Prompt sistem pengganti dengan panjang yang mirip ASKARINA_INTERNAL_PROMPT di proyek.py
+SYSTEM_PROMPT = "Anda adalah ASKARINA, Asisten Kawal B2B Telkom Indonesia. " * 12
+
+SEGMENTS = ["DGS", "DBS", "DES", "DSS", "REG"]
+WITELS = ["Jakarta Selatan", "Jakarta Barat", "Bandung", "Surabaya", "Medan", "Makassar", "Semarang", "Denpasar"]
+STATUSES = ["Aktif", "Prospek", "Negosiasi", "Churn", "Suspend"]
+PRODUCTS = ["Astinet", "IndiHome Bisnis", "Metro Ethernet", "VPN IP", "SIP Trunk", "Cloud Server", "CCTV", "Wifi.id"]
+NAME_WORDS = [
+    "maju", "jaya", "sumber", "rejeki", "abadi", "sentosa", "makmur", "nusantara", "karya", "mandiri", "bangun",
+    "cipta", "prima", "global", "teknik", "logistik", "energi", "sejahtera", "utama", "sinar", "mulia", "permata",
+    "samudra", "bumi", "indah", "agung", "cahaya", "perkasa", "mitra", "solusi", "digital", "media", "persada",
+]
+FIRST_NAMES = ["Budi", "Sari", "Andi", "Dewi", "Rina", "Agus", "Fajar", "Putri", "Hendra", "Wulan", "Yoga", "Intan"]
+LEGAL_FORMS = ["PT", "PT", "PT", "CV", "PT", "Perum"]
+
+QUERY_TEMPLATES = [
+    "siapa AM {name}?",
+    "status pelanggan {name}",
+    "berapa nilai kontrak {typo}",
+    "info {name}",
+    "nipnas {nipnas}",
+    "daftar pelanggan segmen {segment}",
+    "berapa jumlah pelanggan segmen {segment}",
+    "total nilai kontrak segmen {segment}",
+    "pelanggan {product} di witel {witel}",
+    "tolong carikan data pelanggan {witel} dengan status {status}",
+    "pelanggan yang ditangani {am} di segmen {segment}",
+    "bagaimana strategi upsell untuk {name}?",
+    "analisis potensi churn pelanggan {product} di {witel}",
+]
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def summarize_latencies(latencies):
+    total = sum(latencies)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "throughput_qps": len(latencies) / total if total else 0.0,
+    }
+
+
+def make_customer_sheet(rows, seed=0):
+    """DataFrame sintetis dengan kolom yang mirip spreadsheet pelanggan B2B."""
+    rng = random.Random(seed)
+    names = []
+    for i in range(rows):
+        words = " ".join(rng.sample(NAME_WORDS, rng.randint(2, 3))).title()
+        names.append(f"{rng.choice(LEGAL_FORMS)} {words} {i}")
+    return pd.DataFrame({
+        "NIPNAS": [str(4000000 + i) for i in range(rows)],
+        "Nama Pelanggan": names,
+        "Segmen": [rng.choice(SEGMENTS) for _ in range(rows)],
+        "Witel": [rng.choice(WITELS) for _ in range(rows)],
+        "AM": [f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)}" for _ in range(rows)],
+        "Produk": [rng.choice(PRODUCTS) for _ in range(rows)],
+        "Status": [rng.choice(STATUSES) for _ in range(rows)],
+        "Nilai Kontrak": [f"Rp {rng.randint(1, 5000) * 1000000:,}".replace(",", ".") for _ in range(rows)],
+        "Catatan": [rng.choice(["", "", "Perpanjangan kontrak Q3", "Minta penawaran ulang", "Keluhan SLA"]) for _ in range(rows)],
+    })
+
+
+def _typo(word, rng):
+    if len(word) < 5:
+        return word
+    position = rng.randint(1, len(word) - 2)
+    return word[:position] + word[position + 1:]
+
+
+def make_query_corpus(df, count, seed=0):
+    """Pertanyaan Bahasa Indonesia yang realistis: lookup, agregat, pencarian bebas, dan pertanyaan terbuka."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        row = df.iloc[rng.randrange(len(df))]
+        name = row["Nama Pelanggan"]
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            name=name,
+            typo=" ".join(_typo(word, rng) for word in name.split()[1:]),
+            nipnas=row["NIPNAS"],
+            segment=rng.choice(SEGMENTS),
+            product=rng.choice(PRODUCTS),
+            witel=rng.choice(WITELS),
+            status=rng.choice(STATUSES).lower(),
+            am=row["AM"].split()[0],
+        ))
+    return queries
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages, lines_per_page=45, seed=0):
+    """PDF sintetis berisi teks Bahasa Indonesia, ditulis langsung tanpa pustaka tambahan."""
+    rng = random.Random(seed)
+    vocabulary = NAME_WORDS + ["layanan", "pelanggan", "jaringan", "kontrak", "harga", "produk", "teknis", "operasional"]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Halaman {page + 1}"] + [
+            " ".join(rng.choice(vocabulary) for _ in range(12)) for _ in range(lines_per_page)
+        ]
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+class StubProvider:
+    """Penyedia LLM palsu yang langsung mengalirkan jawaban tetap, agar benchmark berjalan offline."""
+
+    model = "stub"
+
+    def __init__(self, answer="Baik, berikut data pelanggan yang Anda minta. " * 5):
+        self.chunks = answer.split(" ")
+
+    def stream(self, messages):
+        for chunk in self.chunks:
+            yield chunk + " "
+
+    async def astream(self, messages):
+        for chunk in self.chunks:
+            yield chunk + " "
+
+
+def build_indexes(df):
+    df = compact_dataframe(df)
+    names = build_name_index(df)
+    return df, build_search_index(df), names, build_structured_index(df, names)
+
+
+def bench_database(rows, query_count, seed=0, trace_memory=False):
+    df = make_customer_sheet(rows, seed)
+    started = time.perf_counter()
+    df, index, names, structured = build_indexes(df)
+    build_seconds = time.perf_counter() - started
+    build_peak = None
+    if trace_memory:
+        # tracemalloc memperlambat build beberapa kali lipat, jadi diukur di putaran terpisah
+        tracemalloc.start()
+        build_indexes(make_customer_sheet(rows, seed))
+        build_peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    queries = make_query_corpus(df, query_count, seed)
+    router = ProviderRouter(providers={"stub": StubProvider()}, routes={"internal": ["stub"]})
+    history = ChatHistoryManager()
+    previous_messages = []
+    context_latencies, turn_latencies, fast_latencies = [], [], []
+    prompt_tokens, fast_hits = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        direct = answer_structured_query(query, structured)
+        if direct is not None:
+            fast_latencies.append(time.perf_counter() - started)
+            fast_hits += 1
+            continue
+        context_started = time.perf_counter()
+        context = find_relevant_context(query, df, index, model="telkom-ai", name_index=names)
+        context_latencies.append(time.perf_counter() - context_started)
+        api_messages = history.as_openai_messages(SYSTEM_PROMPT, previous_messages)
+        api_messages.append({"role": "user", "content": question_with_context(query, context)})
+        prompt_tokens.append(sum(estimate_tokens(message["content"]) for message in api_messages))
+        answer = "".join(router.stream("internal", api_messages))
+        turn_latencies.append(time.perf_counter() - started)
+        previous_messages = (previous_messages + [
+            {"role": "user", "content": query}, {"role": "assistant", "content": answer},
+        ])[-12:]
+
+    return {
+        "rows": rows,
+        "queries": len(queries),
+        "build_seconds": build_seconds,
+        "build_peak_mb": build_peak,
+        "process_peak_rss_mb": peak_rss_mb(),
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "fast_path_hit_rate": fast_hits / len(queries) if queries else 0.0,
+        "fast_path": summarize_latencies(fast_latencies),
+        "find_relevant_context": summarize_latencies(context_latencies),
+        "llm_turn_stubbed": summarize_latencies(turn_latencies),
+        "prompt_tokens_p50": percentile(prompt_tokens, 50),
+        "prompt_tokens_max": max(prompt_tokens, default=0),
+    }
+
+
+def bench_pdf(pages, seed=0):
+    data = make_pdf(pages, seed=seed)
+    results = {"pages": pages, "pdf_mb": len(data) / 1e6}
+
+    started = time.perf_counter()
+    text = extract_pdf_text(data)
+    results["extract_sequential_seconds"] = time.perf_counter() - started
+
+    executor = create_executor()
+    try:
+        # Memanaskan proses pekerja agar waktu start proses "spawn" tidak ikut terukur
+        list(executor.map(count_pages, [data] * executor._max_workers))
+        started = time.perf_counter()
+        extract_pdf_text(data, executor)
+        results["extract_parallel_seconds"] = time.perf_counter() - started
+    finally:
+        executor.shutdown()
+
+    knowledge = KnowledgeIndex()
+    started = time.perf_counter()
+    knowledge.add_document("benchmark.pdf", text)
+    results["knowledge_index_seconds"] = time.perf_counter() - started
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(200):
+        query = " ".join(rng.sample(NAME_WORDS, 3))
+        started = time.perf_counter()
+        knowledge.search(query)
+        latencies.append(time.perf_counter() - started)
+    results["knowledge_search"] = summarize_latencies(latencies)
+    results["text_chars"] = len(text)
+    return results
+
+
+def print_database_result(result):
+    print(f"\n== Database {result['rows']:,} baris ({result['queries']} pertanyaan) ==")
+    memory = f"frame {result['frame_mb']:.1f} MB"
+    if result["build_peak_mb"] is not None:
+        memory += f", puncak alokasi build {result['build_peak_mb']:.1f} MB"
+    if result["process_peak_rss_mb"] is not None:
+        memory += f", RSS puncak proses {result['process_peak_rss_mb']:.0f} MB"
+    print(f"  build indeks      : {result['build_seconds']:.2f} s, {memory}")
+    print(f"  jalur cepat       : {result['fast_path_hit_rate']:.0%} terjawab tanpa LLM")
+    for label, key in [("  jalur cepat", "fast_path"), ("  konteks", "find_relevant_context"),
+                       ("  giliran LLM stub", "llm_turn_stubbed")]:
+        stats = result[key]
+        print(f"{label:<20}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+              f"{stats['throughput_qps']:.0f} q/s")
+    print(f"  ukuran prompt     : p50 {result['prompt_tokens_p50']} token, maks {result['prompt_tokens_max']} token")
+
+
+def print_pdf_result(result):
+    print(f"\n== PDF {result['pages']} halaman ({result['pdf_mb']:.1f} MB, {result['text_chars']:,} karakter) ==")
+    print(f"  ekstraksi berurutan : {result['extract_sequential_seconds']:.2f} s")
+    print(f"  ekstraksi paralel   : {result['extract_parallel_seconds']:.2f} s")
+    print(f"  indeks pengetahuan  : {result['knowledge_index_seconds']:.2f} s")
+    stats = result["knowledge_search"]
+    print(f"  cari potongan       : p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline jalur pencarian dan penyusunan prompt ASKARINA")
+    parser.add_argument("--rows", default="1000,10000,100000", help="ukuran sheet, dipisah koma (mis. 1000,1000000)")
+    parser.add_argument("--queries", type=int, default=300, help="jumlah pertanyaan per ukuran sheet")
+    parser.add_argument("--pdf-pages", type=int, default=300)
+    parser.add_argument("--skip-pdf", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="ukur puncak alokasi build dengan tracemalloc (lambat)")
+    parser.add_argument("--json", help="simpan hasil mentah ke file JSON ini")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {"database": [], "pdf": None}
+    for rows in [int(value) for value in args.rows.split(",") if value]:
+        result = bench_database(rows, args.queries, args.seed, args.trace_memory)
+        results["database"].append(result)
+        print_database_result(result)
+    if not args.skip_pdf:
+        results["pdf"] = bench_pdf(args.pdf_pages, args.seed)
+        print_pdf_result(results["pdf"])
+    results["peak_rss_mb"] = peak_rss_mb()
+    if results["peak_rss_mb"] is not None:
+        print(f"\nRSS puncak proses: {results['peak_rss_mb']:.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# Penyimpanan state percakapan dan user_data bot Telegram yang bisa dibagi beberapa proses worker
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from telegram import Update
+from telegram.ext import BaseHandler, BasePersistence, ConversationHandler, PersistenceInput
+
+from database_cache import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# "redis://host:6379/0" untuk Redis (butuh paket redis), "sqlite:///path/state.db" atau path file untuk SQLite
+TELEGRAM_STATE_URL = os.getenv("TELEGRAM_STATE_URL", "")
+DEFAULT_STATE_PATH = os.path.join(SNAPSHOT_DIR, "telegram_state.db")
+# Cadangan penulisan berkala; setiap update sudah langsung disimpan oleh `save_state_after_update`
+STATE_UPDATE_INTERVAL = float(os.getenv("TELEGRAM_STATE_UPDATE_INTERVAL", "30"))
+
+USER_DATA_NAMESPACE = "user_data"
+# Kunci di user_data untuk state SharedConversationHandler: {nama_percakapan: {chat_id: state}}
+CONVERSATIONS_KEY = "_conversations"
+
+
+class SqliteStateStore:
+    """Key-value per namespace di satu file SQLite; aman dipakai beberapa proses di satu mesin."""
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # WAL: pembaca tidak memblokir penulis dari proses lain
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)", (namespace, key, value)
+            )
+            self._conn.commit()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def items(self, namespace):
+        with self._lock:
+            return self._conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStateStore:
+    """Key-value per namespace sebagai hash Redis; bisa dibagi worker di beberapa node."""
+
+    def __init__(self, url, prefix="askarina"):
+        import redis
+
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _hash(self, namespace):
+        return f"{self.prefix}:{namespace}"
+
+    def get(self, namespace, key):
+        return self._client.hget(self._hash(namespace), key)
+
+    def set(self, namespace, key, value):
+        self._client.hset(self._hash(namespace), key, value)
+
+    def delete(self, namespace, key):
+        self._client.hdel(self._hash(namespace), key)
+
+    def items(self, namespace):
+        return list(self._client.hgetall(self._hash(namespace)).items())
+
+    def close(self):
+        self._client.close()
+
+
+def open_state_store(url=TELEGRAM_STATE_URL):
+    """Membuka store sesuai URL; tanpa URL dipakai file SQLite di folder cache."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            store = RedisStateStore(url)
+            logger.info("State bot Telegram disimpan di Redis.")
+            return store
+        except ImportError:
+            logger.warning("TELEGRAM_STATE_URL menunjuk ke Redis tetapi paket redis tidak terpasang; memakai SQLite.")
+            url = ""
+    path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+    store = SqliteStateStore(path or DEFAULT_STATE_PATH)
+    logger.info(f"State bot Telegram disimpan di SQLite {store.path}.")
+    return store
+
+
+class SharedStatePersistence(BasePersistence):
+    """Persistence PTB untuk user_data di atas store bersama.
+
+    user_data dibaca ulang dari store sebelum setiap update (`refresh_user_data`), sehingga
+    pengguna yang update-nya jatuh ke worker lain tetap melihat data terbarunya. State
+    percakapan ikut di dalam user_data (lihat SharedConversationHandler).
+    """
+
+    def __init__(self, store, update_interval=STATE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+
+    # --- user_data ---
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(self.store.items, USER_DATA_NAMESPACE)
+        return {int(user_id): json.loads(value) for user_id, value in rows}
+
+    async def update_user_data(self, user_id, data):
+        await asyncio.to_thread(self.store.set, USER_DATA_NAMESPACE, str(user_id), json.dumps(data, ensure_ascii=False))
+
+    async def refresh_user_data(self, user_id, user_data):
+        value = await asyncio.to_thread(self.store.get, USER_DATA_NAMESPACE, str(user_id))
+        user_data.clear()
+        if value is not None:
+            user_data.update(json.loads(value))
+
+    async def drop_user_data(self, user_id):
+        await asyncio.to_thread(self.store.delete, USER_DATA_NAMESPACE, str(user_id))
+
+    # --- Data yang tidak dipakai bot ini ---
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await asyncio.to_thread(self.store.close)
+
+
+class SharedConversationHandler(BaseHandler):
+    """Percakapan bertahap seperti ConversationHandler, dengan state per chat disimpan di user_data.
+
+    ConversationHandler bawaan menyimpan state di memori proses dan hanya memuatnya dari
+    persistence saat start, sehingga worker lain tidak melihat perpindahan state. Di sini state
+    dibaca dari `context.user_data`, yang sudah dimuat ulang secara async dari store bersama
+    sebelum `handle_update` dipanggil, dan ikut tersimpan bersama user_data setelah update.
+    Semantik yang didukung: `entry_points` saat belum ada state, handler milik state saat ini
+    lalu `fallbacks`; callback yang mengembalikan None tetap di state yang sama, END mengakhiri.
+    """
+
+    END = ConversationHandler.END
+
+    def __init__(self, entry_points, states, fallbacks, name):
+        super().__init__(self._route)
+        self.entry_points = entry_points
+        self.states = states
+        self.fallbacks = fallbacks
+        self.name = name
+        self._handlers = entry_points + [handler for handlers in states.values() for handler in handlers] + fallbacks
+
+    def check_update(self, update):
+        # State belum diketahui di sini (check_update sinkron); cukup pastikan ada handler yang cocok
+        if not isinstance(update, Update) or update.effective_user is None or update.effective_chat is None:
+            return None
+        matches = []
+        for handler in self._handlers:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                matches.append((handler, check))
+        return matches or None
+
+    async def handle_update(self, update, application, check_result, context):
+        conversations = context.user_data.get(CONVERSATIONS_KEY, {}).get(self.name, {})
+        key = str(update.effective_chat.id)
+        state = conversations.get(key)
+        candidates = self.entry_points if state is None else self.states.get(state, []) + self.fallbacks
+        checks = {id(handler): check for handler, check in check_result}
+        for handler in candidates:
+            if id(handler) in checks:
+                new_state = await handler.handle_update(update, application, checks[id(handler)], context)
+                self._set_state(context.user_data, key, state if new_state is None else new_state)
+                return new_state
+        return None
+
+    def _set_state(self, user_data, key, state):
+        # Callback seperti `start` boleh mengosongkan user_data; state ditulis setelah callback selesai
+        conversations = user_data.setdefault(CONVERSATIONS_KEY, {}).setdefault(self.name, {})
+        if state is None or state == self.END:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = state
+
+    async def _route(self, update, context):
+        # Tidak dipakai: handle_update memanggil handler di dalamnya secara langsung
+        return None
+
+
+async def save_state_after_update(update, context):
+    """Menyimpan user_data dan state percakapan segera setelah update selesai diproses."""
+    if update.effective_user is not None:
+        context.application.mark_data_for_update_persistence(user_ids=update.effective_user.id)
+    await context.application.update_persistence()
@@ -0,0 +1,147 @@
+# Pengelola riwayat percakapan dengan anggaran token untuk coba.py dan proyek.py
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import PRIORITY_BATCH, get_admission_controller, get_provider_limiter
+from context_packer import estimate_tokens
+from llm_clients import DEFAULT_GEMINI_MODEL, gemini_request_options, get_gemini_model
+from provider_router import provider_for_model
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = 2000
+KEEP_RECENT_MESSAGES = 6
+# Batas tunggu kuota lokal Gemini untuk peringkasan; bila habis, pembaruan ringkasan dilewati
+SUMMARY_QUOTA_WAIT = float(os.getenv("HISTORY_SUMMARY_QUOTA_WAIT", "10"))
+SUMMARY_PROMPT = """Ringkas percakapan berikut secara padat dalam bahasa yang sama dengan percakapan.
+Pertahankan fakta, nama, angka, dan keputusan penting. Gabungkan dengan ringkasan sebelumnya jika ada.
+
+Ringkasan sebelumnya:
+{summary}
+
+Percakapan baru:
+{transcript}
+"""
+
+# Ringkasan diperbarui di thread latar belakang agar tidak menambah latensi giliran chat
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+
+def format_transcript(messages):
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def build_summary_prompt(summary, messages):
+    return SUMMARY_PROMPT.format(summary=summary or "-", transcript=format_transcript(messages))
+
+
+def gemini_summarizer(model_name=DEFAULT_GEMINI_MODEL):
+    """Fungsi `summarize` untuk ChatHistoryManager yang ikut kuota lokal Gemini dan antrean batch.
+
+    Mengembalikan None (ringkasan tidak diperbarui) bila kuota tidak tersedia dalam SUMMARY_QUOTA_WAIT.
+    """
+    def summarize(summary_prompt):
+        model = get_gemini_model(model_name)
+        if model is None:
+            raise RuntimeError("GEMINI_API_KEY tidak dikonfigurasi")
+        # Kuota ditunggu sebelum mengambil slot, agar slot tidak tertahan selama menunggu kuota
+        provider = provider_for_model(model_name)
+        if provider and not get_provider_limiter().acquire(provider, SUMMARY_QUOTA_WAIT):
+            return None
+        with get_admission_controller().acquire(None, PRIORITY_BATCH, timeout=None):
+            return model.generate_content(summary_prompt, request_options=gemini_request_options()).text
+
+    return summarize
+
+
+class ChatHistoryManager:
+    """Menyimpan giliran terbaru apa adanya dan melipat giliran lama ke ringkasan berjalan.
+
+    `summarize(prompt) -> str` dipanggil di latar belakang dan boleh mengembalikan None untuk
+    melewati pembaruan; tanpa fungsi ini giliran lama cukup dibuang begitu melewati anggaran.
+    """
+
+    def __init__(self, summarize=None, token_budget=HISTORY_TOKEN_BUDGET, keep_recent_messages=KEEP_RECENT_MESSAGES):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_recent_messages = keep_recent_messages
+        self.summary = ""
+        self.summarized_count = 0
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.summary = ""
+            self.summarized_count = 0
+
+    def select(self, messages):
+        """Mengembalikan (ringkasan, pesan_terbaru) untuk riwayat `messages` (tanpa pertanyaan saat ini)."""
+        with self._lock:
+            summary, summarized_count = self.summary, min(self.summarized_count, len(messages))
+        budget = self.token_budget - estimate_tokens(summary)
+        recent_start = len(messages)
+        while recent_start > summarized_count and len(messages) - recent_start < self.keep_recent_messages:
+            cost = estimate_tokens(messages[recent_start - 1]["content"])
+            if cost > budget and recent_start < len(messages):
+                break
+            budget -= cost
+            recent_start -= 1
+        if recent_start > summarized_count:
+            self._schedule_summary(messages[:recent_start])
+        return summary, messages[recent_start:]
+
+    def _schedule_summary(self, messages):
+        if self.summarize is None or (self._pending is not None and not self._pending.done()):
+            return
+        self._pending = _SUMMARY_EXECUTOR.submit(self._refresh_summary, list(messages))
+
+    def _refresh_summary(self, messages):
+        with self._lock:
+            summary, start = self.summary, self.summarized_count
+        try:
+            new_summary = self.summarize(build_summary_prompt(summary, messages[start:]))
+        except Exception as e:
+            logger.error(f"Error saat meringkas riwayat percakapan: {e}")
+            return
+        if new_summary is None:
+            logger.info("Kuota LLM tidak tersedia, pembaruan ringkasan riwayat dilewati.")
+            return
+        with self._lock:
+            # Abaikan hasil jika riwayat sudah direset selama peringkasan berjalan
+            if self.summarized_count == start and self.summary == summary:
+                self.summary = new_summary.strip()
+                self.summarized_count = len(messages)
+
+    def as_gemini_history(self, system_prompt, messages, acknowledgement):
+        """Riwayat untuk `GenerativeModel.start_chat`, dengan prompt sistem selalu di awal.
+
+        Prompt sistem dikirim apa adanya (ringkasan menjadi giliran terpisah) agar awalannya
+        identik di setiap permintaan.
+        """
+        summary, recent = self.select(messages)
+        history = [
+            {"role": "user", "parts": [system_prompt]},
+            {"role": "model", "parts": [acknowledgement]},
+        ]
+        if summary:
+            history += [
+                {"role": "user", "parts": [f"Summary of the earlier conversation:\n{summary}"]},
+                {"role": "model", "parts": ["Noted."]},
+            ]
+        for message in recent:
+            role = "user" if message["role"] == "user" else "model"
+            history.append({"role": role, "parts": [message["content"]]})
+        return history
+
+    def as_openai_messages(self, system_prompt, messages):
+        """Pesan untuk API chat kompatibel OpenAI, dengan prompt sistem selalu di awal."""
+        summary, recent = self.select(messages)
+        api_messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            api_messages.append({"role": "system", "content": f"Ringkasan percakapan sebelumnya:\n{summary}"})
+        for message in recent:
+            api_messages.append({"role": message["role"], "content": message["content"]})
+        return api_messages
@@ -1,19 +1,25 @@
 # Impor pustaka (library) yang diperlukan
-import google.generativeai as genai
 import streamlit as st
-import os
 from dotenv import load_dotenv
-import PyPDF2
-import tempfile
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+
+from admission import AdmissionRejected, get_admission_controller, get_provider_limiter
+from chat_history import ChatHistoryManager, gemini_summarizer
+from context_packer import estimate_tokens
+from knowledge_base import KnowledgeIndex, format_chunks, load_knowledge_embedder
+from llm_clients import gemini_request_options, get_gemini_model
+from metrics import start_trace
+from pdf_extract import create_executor, extract_pdf_text
+from provider_router import ProvidersThrottled, provider_for_model
 
 # Muat variabel lingkungan dari file .env (untuk menyimpan kunci API)
 load_dotenv()
 
 st.title("🤖 AI Assistant with Role-Play & Knowledge Base")
 
-# Konfigurasi Gemini API menggunakan kunci yang diambil dari environment
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
 # Daftar peran (role) yang telah ditentukan sebelumnya untuk AI
 # Setiap peran memiliki prompt sistem (perintah) dan ikon sendiri
 ROLES = {
@@ -52,30 +58,59 @@ ROLES = {
 }
 
 
+def content_hash(data):
+    """Menghitung hash isi file sebagai kunci deduplikasi dokumen."""
+    return hashlib.sha256(data).hexdigest()
+
+
+# Process pool untuk ekstraksi PDF, dibuat sekali per proses dan dipakai semua sesi
+@st.cache_resource
+def get_pdf_executor():
+    return create_executor()
+
+
+# Cache teks hasil ekstraksi per hash isi, dipakai bersama lintas rerun dan sesi
+@st.cache_resource
+def get_extracted_text_cache():
+    return OrderedDict()
+
+
+EXTRACTED_TEXT_CACHE_SIZE = 256
+
+
 # Fungsi untuk mengekstrak teks dari file PDF yang diunggah
-def extract_text_from_pdf(pdf_file):
+def extract_text_from_pdf(file_hash, data, name):
     """Mengekstrak teks dari file PDF yang diunggah"""
+    text_cache = get_extracted_text_cache()
+    if file_hash in text_cache:
+        text_cache.move_to_end(file_hash)
+        return text_cache[file_hash]
+    progress_bar = st.progress(0.0, text=f"📄 Processing: {name}")
     try:
-        # Buat file sementara untuk menyimpan PDF yang diunggah
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(pdf_file.getvalue())
-            tmp_file_path = tmp_file.name
-
-        # Buka dan baca file PDF sementara
-        with open(tmp_file_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            # Loop setiap halaman dalam PDF untuk mengambil teksnya
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-
-        # Hapus file sementara setelah selesai diproses
-        os.unlink(tmp_file_path)
-        return text
+        # Halaman dibagi ke beberapa proses; progres per rentang halaman ditampilkan di sidebar
+        text = extract_pdf_text(
+            data,
+            executor=get_pdf_executor(),
+            on_progress=lambda done, total: progress_bar.progress(
+                done / total, text=f"📄 Processing: {name} ({done}/{total} pages)"
+            ),
+        )
     except Exception as e:
         # Tampilkan pesan error jika gagal mengekstrak teks
         st.error(f"Error extracting PDF text: {str(e)}")
         return None
+    finally:
+        progress_bar.empty()
+    text_cache[file_hash] = text
+    while len(text_cache) > EXTRACTED_TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return text
+
+
+# Model embedding (opsional) dimuat sekali per proses dan dipakai semua sesi
+@st.cache_resource
+def get_knowledge_embedder():
+    return load_knowledge_embedder()
 
 
 # --- Bagian Sidebar untuk Konfigurasi ---
@@ -94,35 +129,38 @@ with st.sidebar:
         "Upload PDF documents:", type=["pdf"], accept_multiple_files=True
     )
 
+    # Inisialisasi indeks basis pengetahuan di session_state jika belum ada
+    if "knowledge_index" not in st.session_state:
+        st.session_state.knowledge_index = KnowledgeIndex(get_knowledge_embedder())
+
     # Proses file yang diunggah
     if uploaded_files:
-        # Inisialisasi 'knowledge_base' di session_state jika belum ada
-        if "knowledge_base" not in st.session_state:
-            st.session_state.knowledge_base = ""
+        knowledge_index = st.session_state.knowledge_index
 
-        # Ekstrak teks dari file-file yang baru diunggah
-        new_knowledge = ""
+        # Ekstrak dan indeks hanya dokumen yang isinya belum ada di basis pengetahuan
+        new_documents = 0
         for pdf_file in uploaded_files:
-            st.write(f"📄 Processing: {pdf_file.name}")
-            pdf_text = extract_text_from_pdf(pdf_file)
+            data = pdf_file.getvalue()
+            file_hash = content_hash(data)
+            if file_hash in knowledge_index.content_hashes:
+                continue
+            pdf_text = extract_text_from_pdf(file_hash, data, pdf_file.name)
             if pdf_text:
-                # Tambahkan teks dari PDF ke variabel dengan format penanda
-                new_knowledge += f"\n\n=== DOCUMENT: {pdf_file.name} ===\n{pdf_text}"
+                # Dokumen dipotong menjadi chunk dan diindeks, bukan ditempel utuh ke prompt
+                knowledge_index.add_document(pdf_file.name, pdf_text, file_hash)
+                new_documents += 1
 
-        # Perbarui basis pengetahuan jika ada konten baru dan belum ada sebelumnya
-        if new_knowledge and new_knowledge not in st.session_state.knowledge_base:
-            st.session_state.knowledge_base += new_knowledge
-            st.success(f"✅ Processed {len(uploaded_files)} document(s)")
+        if new_documents:
+            st.success(f"✅ Processed {new_documents} document(s)")
 
     # Tombol untuk menghapus seluruh basis pengetahuan
     if st.button("🗑️ Clear Knowledge Base"):
-        st.session_state.knowledge_base = ""
+        st.session_state.knowledge_index = KnowledgeIndex(get_knowledge_embedder())
         st.success("Knowledge base cleared!")
 
     # Tampilkan status basis pengetahuan (jumlah kata)
-    if "knowledge_base" in st.session_state and st.session_state.knowledge_base:
-        word_count = len(st.session_state.knowledge_base.split())
-        st.metric("Knowledge Base", f"{word_count} words")
+    if st.session_state.knowledge_index.documents:
+        st.metric("Knowledge Base", f"{st.session_state.knowledge_index.word_count} words")
 
 # --- Inisialisasi Session State ---
 # Session state digunakan untuk menyimpan data antar interaksi pengguna
@@ -135,6 +173,16 @@ if "gemini_model" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# ID sesi untuk batas laju dan antrean panggilan LLM (admission.py)
+if "admission_id" not in st.session_state:
+    st.session_state.admission_id = f"coba-{uuid.uuid4().hex}"
+
+# Inisialisasi pengelola riwayat percakapan jika belum ada
+if "history_manager" not in st.session_state:
+    st.session_state.history_manager = ChatHistoryManager(
+        summarize=gemini_summarizer(st.session_state["gemini_model"])
+    )
+
 # Inisialisasi peran saat ini jika belum ada
 if "current_role" not in st.session_state:
     st.session_state.current_role = selected_role
@@ -142,6 +190,7 @@ if "current_role" not in st.session_state:
 # Atur ulang percakapan jika pengguna mengganti peran AI
 if st.session_state.current_role != selected_role:
     st.session_state.messages = []  # Kosongkan riwayat chat
+    st.session_state.history_manager.reset()
     st.session_state.current_role = selected_role
     st.rerun()  # Muat ulang aplikasi untuk menerapkan perubahan
 
@@ -164,66 +213,88 @@ if prompt := st.chat_input("What can I help you with?"):
 
     # Hasilkan respons dari asisten AI
     with st.chat_message("assistant"):
-        # Inisialisasi model Generative AI
-        model = genai.GenerativeModel(st.session_state["gemini_model"])
+        # Ambil model Generative AI dari registry (dibuat sekali per proses)
+        model = get_gemini_model(st.session_state["gemini_model"])
 
         # Bangun prompt sistem dengan instruksi peran
         system_prompt = ROLES[selected_role]["system_prompt"]
 
-        # Tambahkan konteks dari basis pengetahuan jika tersedia
-        if "knowledge_base" in st.session_state and st.session_state.knowledge_base:
-            system_prompt += f"""
+        # Durasi setiap tahap giliran ini dicatat ke log dan sink metrik
+        trace = start_trace("chat", selected_role, "coba")
+        trace.set(provider="gemini", model=st.session_state["gemini_model"])
 
-            IMPORTANT: You have access to the following knowledge base from uploaded documents. Use this information to answer questions when relevant:
+        # Ambil hanya potongan dokumen yang paling relevan dengan pertanyaan ini
+        knowledge_context = ""
+        with trace.stage("knowledge_search"):
+            relevant_chunks = st.session_state.knowledge_index.search(prompt)
+        if relevant_chunks:
+            knowledge_context = f"""IMPORTANT: The following excerpts from uploaded documents may be relevant. Use this information to answer the question when relevant:
 
-            {st.session_state.knowledge_base}
+            {format_chunks(relevant_chunks)}
 
-            When answering questions, prioritize information from the knowledge base when applicable. If the answer is found in the uploaded documents, mention which document it came from.
+            When answering questions, prioritize information from these excerpts when applicable. If the answer is found in the uploaded documents, mention which document it came from.
             """
 
-        # Konversi riwayat pesan ke format yang sesuai untuk Gemini
-        chat_history = []
-
-        # Tambahkan prompt sistem sebagai pesan pertama jika ini awal percakapan
-        if not st.session_state.messages[:-1]:
-            chat_history.append({"role": "user", "parts": [system_prompt]})
-            chat_history.append(
-                {
-                    "role": "model",
-                    "parts": [
-                        "I understand. I'll act according to my role and use the knowledge base when relevant. How can I help you?"
-                    ],
-                }
-            )
-
-        # Tambahkan riwayat percakapan sebelumnya (semua kecuali pesan terakhir dari pengguna)
-        for msg in st.session_state.messages[:-1]:
-            role = "user" if msg["role"] == "user" else "model"
-            chat_history.append({"role": role, "parts": [msg["content"]]})
-
-        # Mulai sesi chat dengan riwayat yang sudah ada
+        # Riwayat dipadatkan: prompt sistem selalu di awal, giliran terbaru apa adanya,
+        # dan giliran lama dilipat ke ringkasan yang diperbarui di latar belakang
+        chat_history = st.session_state.history_manager.as_gemini_history(
+            system_prompt,
+            st.session_state.messages[:-1],
+            "I understand. I'll act according to my role and use the knowledge base when relevant. How can I help you?",
+        )
+
+        # Mulai sesi chat dengan riwayat yang sudah dipadatkan
         chat = model.start_chat(history=chat_history)
 
-        # Gabungkan prompt sistem dengan pertanyaan pengguna hanya untuk interaksi pertama
-        if not st.session_state.messages[:-1]:
-            full_prompt = f"{system_prompt}\n\nUser question: {prompt}"
+        # Potongan dokumen yang relevan disertakan di setiap pertanyaan
+        if knowledge_context:
+            full_prompt = f"{knowledge_context}\n\nUser question: {prompt}"
         else:
             full_prompt = prompt
 
-        # Kirim pesan dan dapatkan respons secara streaming
-        response = chat.send_message(full_prompt, stream=True)
+        trace.set(tokens_in=sum(estimate_tokens(" ".join(turn["parts"])) for turn in chat_history) + estimate_tokens(full_prompt))
 
-        # Tampilkan respons secara streaming (efek ketikan)
+        # Kirim pesan dan dapatkan respons secara streaming
         response_text = ""
         response_container = st.empty()
-        for chunk in response:
-            if chunk.text:
-                response_text += chunk.text
-                # Tambahkan kursor berkedip untuk efek visual
-                response_container.markdown(response_text + "▌")
+        status = "ok"
+
+        def show_queue_position(position):
+            trace.set(queue_position=position)
+            response_container.markdown(f"⏳ Your request is queued, position {position}.")
+
+        try:
+            # Slot panggilan LLM dan kuota Gemini dibagi semua sesi di proses ini
+            queued_at = time.monotonic()
+            with get_admission_controller().acquire(st.session_state.admission_id, on_queued=show_queue_position):
+                trace.add_stage("slot_wait", time.monotonic() - queued_at)
+                provider = provider_for_model(st.session_state["gemini_model"])
+                wait = get_provider_limiter().try_acquire(provider) if provider else 0
+                if wait:
+                    raise ProvidersThrottled(wait)
+                with trace.stage("generation"):
+                    generation_started = time.monotonic()
+                    response = chat.send_message(full_prompt, stream=True, request_options=gemini_request_options(stream=True))
+
+                    # Tampilkan respons secara streaming (efek ketikan)
+                    for chunk in response:
+                        if chunk.text:
+                            if not response_text:
+                                trace.set(ttft_seconds=time.monotonic() - generation_started)
+                            response_text += chunk.text
+                            # Tambahkan kursor berkedip untuk efek visual
+                            response_container.markdown(response_text + "▌")
+        except (AdmissionRejected, ProvidersThrottled) as e:
+            response_text = str(e)
+            status = "shed"
+        except Exception as e:
+            # Error Gemini tetap ditutup di trace agar tercatat di metrik, bukan hilang bersama traceback
+            response_text = f"Error generating response: {e}"
+            status = "error"
 
         # Tampilkan respons final tanpa kursor
         response_container.markdown(response_text)
+        trace.finish(status, response_text)
 
     # Tambahkan respons dari asisten ke riwayat chat untuk ditampilkan di interaksi selanjutnya
     st.session_state.messages.append({"role": "assistant", "content": response_text})
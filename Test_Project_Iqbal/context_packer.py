@@ -0,0 +1,105 @@
+# Modul untuk menyusun konteks database yang ringkas dan dibatasi anggaran token per model
+import pandas as pd
+
+# Anggaran token konteks per model; model lain memakai DEFAULT_CONTEXT_TOKENS
+CONTEXT_TOKEN_BUDGETS = {
+    "telkom-ai": 3000,
+    "gemini-1.5-flash": 8000,
+}
+DEFAULT_CONTEXT_TOKENS = 3000
+MAX_COLUMNS = 12
+
+# Perkiraan kasar: satu token ~ 4 karakter untuk teks campuran Indonesia/Inggris
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def get_context_budget(model):
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def is_empty(value):
+    if value is None:
+        return True
+    try:
+        if pd.isna(value):
+            return True
+    except (TypeError, ValueError):
+        pass
+    return str(value).strip() in ("", "-", "nan", "None")
+
+
+def _contains_any(value, keywords):
+    text = str(value).lower()
+    return any(keyword in text for keyword in keywords)
+
+
+def select_columns(df, keywords, max_columns=MAX_COLUMNS):
+    """Memilih kolom yang tidak kosong, mengutamakan kolom yang disebut atau cocok dengan pertanyaan."""
+    keywords = [keyword.lower() for keyword in keywords]
+    ranked = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if values.map(is_empty).all():
+            continue  # kolom yang kosong di semua baris terpilih tidak dikirim
+        mentioned = _contains_any(column, keywords)
+        matched = any(_contains_any(value, keywords) for value in values.dropna().unique())
+        ranked.append((not mentioned, not matched, position, column))
+    ranked.sort()
+    chosen = {column for _, _, _, column in ranked[:max_columns]}
+    # Tetap pertahankan urutan kolom asli agar mudah dibaca
+    return [column for column in df.columns if column in chosen]
+
+
+def encode_row(row, columns):
+    """Mengodekan satu baris sebagai `kolom: nilai` tanpa sel kosong atau nilai berulang."""
+    parts = []
+    seen_values = set()
+    for column in columns:
+        value = row[column]
+        if is_empty(value):
+            continue
+        text = " ".join(str(value).split())
+        if text.lower() in seen_values:
+            continue
+        seen_values.add(text.lower())
+        parts.append(f"{column}: {text}")
+    return " | ".join(parts)
+
+
+def pack_context(df, keywords, token_budget=DEFAULT_CONTEXT_TOKENS):
+    """Menyusun baris `df` (sudah terurut berdasarkan relevansi) hingga anggaran token habis.
+
+    Mengembalikan tuple (teks_konteks, jumlah_baris_terpotong).
+    """
+    columns = select_columns(df, keywords)
+    lines = []
+    used_tokens = 0
+    seen_lines = set()
+    packed = 0
+    for _, row in df.iterrows():
+        line = encode_row(row, columns)
+        if not line or line in seen_lines:
+            packed += 1
+            continue
+        line_tokens = estimate_tokens(line) + 1
+        if used_tokens + line_tokens > token_budget and lines:
+            break
+        seen_lines.add(line)
+        lines.append(line)
+        used_tokens += line_tokens
+        packed += 1
+    truncated = len(df) - packed
+    return "\n".join(lines), truncated
+
+
+def question_with_context(question, context):
+    """Pesan user yang membawa konteks database per pertanyaan.
+
+    Konteks ditaruh di giliran user, bukan di prompt sistem, agar prompt sistem tetap
+    identik byte per byte di setiap permintaan dan bisa di-cache oleh penyedia.
+    """
+    return f"Data pelanggan yang relevan:\n{context}\n\nPertanyaan: {question}"
@@ -0,0 +1,221 @@
+# Lapisan sumber data pelanggan: beberapa sheet/workbook, CSV, dan SQLite yang dimuat malas dan dirutekan per pertanyaan
+#
+# Contoh data_sources.json (lokasi bisa diganti lewat ASKARINA_DATA_SOURCES):
+# [
+#   {"name": "regional", "url": "https://.../pub?output=xlsx", "sheets": ["Jabar", "Jatim"],
+#    "regions": {"Jabar": ["bandung", "bekasi"], "Jatim": ["surabaya", "malang"]},
+#    "default": true},
+#   {"name": "dgs", "path": "data/dgs.csv", "segments": ["DGS"]},
+#   {"name": "arsip", "path": "data/pelanggan.db", "table": "pelanggan", "keywords": ["arsip", "churn"]}
+# ]
+# Sumber dengan "segments"/"regions"/"keywords" hanya dimuat bila pertanyaan menyebut salah satunya;
+# sumber tanpa penanda rute selalu ikut. Pertanyaan yang tidak cocok dengan penanda mana pun hanya memakai
+# sumber default: sumber tanpa penanda rute dan sumber yang diberi "default": true ("default": false
+# mengecualikannya). Jika konfigurasi tidak punya sumber default sama sekali, semua sumber dipakai
+# (dengan peringatan di log).
+import itertools
+import json
+import logging
+import os
+import threading
+
+from context_packer import DEFAULT_CONTEXT_TOKENS, get_context_budget
+from database_cache import DEFAULT_REFRESH_INTERVAL, DatabaseCache, FileSource, SqliteSource, guess_file_type
+from database_search import NO_MATCH_MESSAGE, find_relevant_context, tokenize
+from response_cache import get_response_cache
+from structured_query import merge_structured_results, resolve_structured_query
+
+logger = logging.getLogger(__name__)
+
+DATA_SOURCES_PATH = os.getenv(
+    "ASKARINA_DATA_SOURCES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_sources.json")
+)
+
+
+class SourceSpec:
+    """Satu sumber data (satu sheet, CSV, atau tabel SQLite) beserta penanda rutenya."""
+
+    def __init__(self, name, source, route_terms=(), default=None):
+        self.name = name
+        self.source = source
+        # Setiap penanda disimpan sebagai frasa token, mis. "jakarta selatan"
+        self.route_terms = [" ".join(tokenize(term)) for term in route_terms if tokenize(term)]
+        # Dipakai untuk pertanyaan yang tidak cocok dengan penanda mana pun
+        self.default = not self.route_terms if default is None else bool(default)
+
+    def matches(self, padded_prompt):
+        return any(f" {term} " in padded_prompt for term in self.route_terms)
+
+
+def _terms_for(entry, key, sheet=None):
+    """Penanda rute dari entri; boleh berupa daftar, atau dict per sheet untuk entri multi-sheet."""
+    value = entry.get(key, [])
+    if isinstance(value, dict):
+        value = value.get(sheet, [])
+    return [value] if isinstance(value, str) else list(value)
+
+
+def parse_source_entries(entries):
+    """Mengubah entri konfigurasi menjadi daftar SourceSpec; entri dengan "sheets" dipecah per sheet."""
+    specs = []
+    for entry in entries:
+        location = entry.get("url") or entry.get("path")
+        if not location:
+            raise ValueError(f"Sumber data {entry.get('name')!r} membutuhkan 'url' atau 'path'")
+        file_type = entry.get("type") or guess_file_type(location)
+        name = entry.get("name") or os.path.basename(location)
+        sheets = entry.get("sheets") or [entry.get("sheet")]
+        for sheet in sheets:
+            route_terms = [
+                term for key in ("segments", "regions", "keywords") for term in _terms_for(entry, key, sheet)
+            ]
+            if file_type == "sqlite":
+                source = SqliteSource(location, table=entry.get("table"), query=entry.get("query"))
+            else:
+                source = FileSource(location, file_type, sheet)
+            spec_name = name if sheet is None or len(sheets) == 1 else f"{name}/{sheet}"
+            specs.append(SourceSpec(spec_name, source, route_terms, entry.get("default")))
+    return specs
+
+
+def load_source_specs(default_url, path=DATA_SOURCES_PATH):
+    """Sumber dari file konfigurasi, atau satu spreadsheet `default_url` (sheet pertama) jika file tidak ada."""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            specs = parse_source_entries(json.load(f))
+        logger.info(f"{len(specs)} sumber data dibaca dari {path}.")
+        return specs
+    return [SourceSpec("database", FileSource(default_url))]
+
+
+class DataView:
+    """Snapshot dari sumber-sumber yang relevan untuk satu pertanyaan."""
+
+    def __init__(self, snapshots, version):
+        self.snapshots = snapshots  # daftar (SourceSpec, DatabaseSnapshot) yang sudah termuat
+        self.version = version
+
+    @property
+    def available(self):
+        return bool(self.snapshots)
+
+    def answer_structured(self, prompt):
+        """Jawaban lookup/agregat langsung.
+
+        Dari beberapa sumber, jumlah/total/rata-rata/daftar digabung menjadi satu jawaban;
+        hanya hasil lookup pelanggan yang ditampilkan per sumber dengan label sumbernya.
+        """
+        results = []
+        for spec, snapshot in self.snapshots:
+            result = resolve_structured_query(prompt, snapshot.structured)
+            if result is not None:
+                results.append((spec.name, result))
+        if len(results) <= 1:
+            return results[0][1].format() if results else None
+        aggregates = {}
+        lookups = []
+        for name, result in results:
+            if result.kind == "lookup":
+                lookups.append(f"**{name}**\n{result.text}")
+            else:
+                aggregates.setdefault(result.kind, []).append(result)
+        merged = [merge_structured_results(group).format() for group in aggregates.values()]
+        return "\n\n".join(merged + lookups)
+
+    def relevant_context(self, prompt, model=None):
+        """Konteks baris relevan; anggaran token konteks dibagi rata antar sumber."""
+        if len(self.snapshots) == 1:
+            snapshot = self.snapshots[0][1]
+            return find_relevant_context(prompt, snapshot.df, snapshot.index, model=model, name_index=snapshot.names)
+        budget = (get_context_budget(model) if model else DEFAULT_CONTEXT_TOKENS) // max(len(self.snapshots), 1)
+        parts = []
+        for spec, snapshot in self.snapshots:
+            context = find_relevant_context(
+                prompt, snapshot.df, snapshot.index, model=model, name_index=snapshot.names, token_budget=budget
+            )
+            if context != NO_MATCH_MESSAGE:
+                parts.append(f"[Sumber: {spec.name}]\n{context}")
+        return "\n\n".join(parts) if parts else NO_MATCH_MESSAGE
+
+
+class DataSourceRegistry:
+    """Memuat setiap sumber saat pertama kali dibutuhkan dan menyimpan indeksnya terpisah.
+
+    `version` naik setiap kali snapshot sumber mana pun berganti, dan dipakai sebagai versi
+    database untuk cache jawaban.
+    """
+
+    def __init__(self, specs, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.specs = specs
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._caches = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+        self._load_locks = {spec.name: threading.Lock() for spec in specs}
+        self.default_specs = [spec for spec in specs if spec.default]
+        if not self.default_specs:
+            logger.warning(
+                "Tidak ada sumber data default; pertanyaan tanpa penanda rute akan memuat semua sumber. "
+                "Tandai sumber dengan \"default\": true di data_sources.json."
+            )
+            self.default_specs = list(specs)
+
+    def route(self, prompt):
+        """Sumber yang relevan untuk `prompt` menurut penanda segmen/region/kata kunci."""
+        padded = f" {' '.join(tokenize(prompt))} "
+        matched = [spec for spec in self.specs if spec.route_terms and spec.matches(padded)]
+        if not matched:
+            return list(self.default_specs)
+        return [spec for spec in self.specs if not spec.route_terms or spec in matched]
+
+    def _on_snapshot(self, snapshot):
+        with self._lock:
+            self.version = next(self._versions)
+            version = self.version
+        # Jawaban yang dibuat dari versi database lama tidak boleh dipakai lagi
+        get_response_cache().invalidate_db_versions(version)
+
+    def cache(self, spec):
+        """DatabaseCache milik `spec`; dimuat dan mulai disegarkan di latar belakang saat pertama diminta."""
+        cache = self._caches.get(spec.name)
+        if cache is not None:
+            return cache
+        with self._load_locks[spec.name]:
+            cache = self._caches.get(spec.name)
+            if cache is None:
+                logger.info(f"Memuat sumber data '{spec.name}' untuk pertama kali.")
+                cache = DatabaseCache(spec.source, self.refresh_interval)
+                cache.add_listener(self._on_snapshot)
+                version = self.version
+                cache.start()
+                # Snapshot dari disk tidak memicu listener, tetapi tetap mengubah data yang tersedia
+                if cache.snapshot.df is not None and self.version == version:
+                    self._on_snapshot(cache.snapshot)
+                self._caches[spec.name] = cache
+        return cache
+
+    def select(self, prompt):
+        """DataView untuk `prompt`; bisa memblokir saat sumber yang dibutuhkan belum pernah dimuat."""
+        snapshots = []
+        for spec in self.route(prompt):
+            snapshot = self.cache(spec).snapshot
+            if snapshot.df is not None and not snapshot.df.empty:
+                snapshots.append((spec, snapshot))
+        return DataView(snapshots, self.version)
+
+    def loaded_sources(self):
+        return [name for name, cache in self._caches.items() if cache.snapshot.df is not None]
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_data_sources(default_url, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """Registry sumber data bersama per proses; `default_url` dipakai bila tidak ada data_sources.json."""
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(default_url)
+        if registry is None:
+            registry = _REGISTRIES[default_url] = DataSourceRegistry(load_source_specs(default_url), refresh_interval)
+    return registry
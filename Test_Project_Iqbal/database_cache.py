@@ -0,0 +1,480 @@
+# Cache database pelanggan yang dipakai bersama dalam satu proses dan diperbarui di latar belakang
+import gc
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import closing
+from io import BytesIO
+from urllib.parse import urlparse
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows tidak punya modul resource
+    resource = None
+
+from database_search import build_search_index
+from metrics import start_trace
+from name_index import build_name_index
+from response_cache import get_response_cache
+from structured_query import build_structured_index
+
+logger = logging.getLogger(__name__)
+
+# Interval pengecekan perubahan spreadsheet (detik)
+DEFAULT_REFRESH_INTERVAL = int(os.getenv("DATABASE_REFRESH_INTERVAL", "300"))
+REQUEST_TIMEOUT = 60
+
+# Lokasi snapshot kolumnar di disk agar start berikutnya tidak perlu parsing openpyxl lagi
+SNAPSHOT_DIR = os.getenv("ASKARINA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".askarina_cache"))
+
+
+class DatabaseSnapshot:
+    """Salinan database yang tidak berubah: DataFrame, indeks pencarian, dan metadata HTTP."""
+
+    def __init__(
+        self, df, index, version, etag=None, last_modified=None, content_hash=None, structured=None, names=None
+    ):
+        self.df = df
+        self.index = index
+        self.structured = structured
+        self.names = names
+        self.version = version
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.loaded_at = time.time()
+
+
+EMPTY_SNAPSHOT = DatabaseSnapshot(None, None, version=0)
+
+# Kolom teks dengan rasio nilai unik di bawah batas ini disimpan sebagai categorical
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def peak_rss_mb():
+    """RSS puncak proses dalam MB, atau None jika tidak bisa diukur di platform ini."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux melaporkan KB, macOS melaporkan byte
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def compact_dataframe(df):
+    """Mengubah tipe kolom agar hemat memori: teks berulang jadi categorical, angka diperkecil.
+
+    Float hanya diperkecil ke float32 jika tidak ada nilai yang berubah (nilai kontrak tetap presisi).
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values):
+            values = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values):
+            downcast = values.astype("float32")
+            if ((downcast.astype(values.dtype) == values) | values.isna()).all():
+                values = downcast
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if len(values) and values.nunique(dropna=True) <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+                values = values.astype("category")
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_snapshot():
+    """Jumlah siklus GC dan RSS puncak proses (MB) saat ini."""
+    return sum(stats["collections"] for stats in gc.get_stats()), peak_rss_mb()
+
+
+def format_rss(rss):
+    return f"{rss:.0f} MB" if rss is not None else "tidak diketahui"
+
+
+def normalize_loaded_df(raw, before=None):
+    """Memadatkan DataFrame hasil parsing dan melaporkan penggunaan memori.
+
+    `before` adalah `memory_snapshot()` yang diambil sebelum parsing; tanpa itu pengukuran dimulai di sini.
+    """
+    gc_before, rss_before = before or memory_snapshot()
+    df = compact_dataframe(raw)
+    raw_mb = raw.memory_usage(deep=True).sum() / 1e6
+    compact_mb = df.memory_usage(deep=True).sum() / 1e6
+    gc_after, rss_after = memory_snapshot()
+    logger.info(
+        f"Normalisasi database: {raw_mb:.1f} MB -> {compact_mb:.1f} MB, "
+        f"RSS puncak {format_rss(rss_before)} -> {format_rss(rss_after)}, "
+        f"siklus GC {gc_before} -> {gc_after} ({gc_after - gc_before} selama parsing dan pemadatan)."
+    )
+    return df
+
+
+def load_database_as_df(content, sheet=0, file_type="xlsx"):
+    """Mengurai isi file XLSX (sheet tertentu, default sheet pertama) atau CSV menjadi DataFrame bertipe ringkas."""
+    before = memory_snapshot()
+    if file_type == "csv":
+        raw = pd.read_csv(BytesIO(content))
+    else:
+        raw = pd.read_excel(BytesIO(content), engine="openpyxl", sheet_name=sheet)
+    return normalize_loaded_df(raw, before)
+
+
+def guess_file_type(location):
+    path = urlparse(location).path.lower() if "://" in location else location.lower()
+    if path.endswith(".csv") or "output=csv" in location.lower():
+        return "csv"
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return "sqlite"
+    return "xlsx"
+
+
+def file_signature(path):
+    """Penanda perubahan file lokal (mtime dan ukuran), dipakai menggantikan ETag."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class FileSource:
+    """File XLSX (satu sheet) atau CSV dari URL, diunduh dengan GET bersyarat, atau dari path lokal."""
+
+    def __init__(self, location, file_type=None, sheet=None):
+        self.location = location
+        self.file_type = file_type or guess_file_type(location)
+        self.sheet = sheet
+        self.key = location if sheet is None else f"{location}#{sheet}"
+        self.remote = urlparse(location).scheme in ("http", "https")
+
+    def fetch(self, current):
+        """Mengembalikan (isi, etag, last_modified), atau None jika sumber tidak berubah."""
+        if not self.remote:
+            signature = file_signature(self.location)
+            if current.etag == signature:
+                return None
+            with open(self.location, "rb") as f:
+                return f.read(), signature, None
+        request = urllib.request.Request(self.location)
+        if current.etag:
+            request.add_header("If-None-Match", current.etag)
+        if current.last_modified:
+            request.add_header("If-Modified-Since", current.last_modified)
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return response.read(), response.headers.get("ETag"), response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+
+    def content_hash(self, payload):
+        return hashlib.sha256(payload).hexdigest()
+
+    def parse(self, payload):
+        return load_database_as_df(payload, 0 if self.sheet is None else self.sheet, self.file_type)
+
+
+class SqliteSource:
+    """Tabel atau query dari database SQLite lokal; dibaca ulang hanya jika file-nya berubah."""
+
+    def __init__(self, path, table=None, query=None):
+        if not (table or query):
+            raise ValueError("Sumber SQLite membutuhkan 'table' atau 'query'")
+        self.path = path
+        self.query = query or f'SELECT * FROM "{table}"'
+        self.key = f"sqlite:{path}?{self.query}"
+
+    def fetch(self, current):
+        signature = file_signature(self.path)
+        if current.etag == signature:
+            return None
+        with closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)) as conn:
+            return pd.read_sql_query(self.query, conn), signature, None
+
+    def content_hash(self, payload):
+        return hashlib.sha256(pd.util.hash_pandas_object(payload, index=False).values.tobytes()).hexdigest()
+
+    def parse(self, payload):
+        return normalize_loaded_df(payload)
+
+
+# Naikkan bila struktur kelas indeks berubah agar pickle indeks lama tidak dipakai
+INDEX_FORMAT_VERSION = 1
+
+
+class SnapshotStore:
+    """Menyimpan DataFrame hasil parsing ke disk (Parquet, atau pickle jika Parquet tidak bisa).
+
+    Indeks pencarian, nama, dan terstruktur ikut disimpan (pickle) agar start berikutnya
+    tidak perlu membangunnya ulang dari seluruh baris.
+    """
+
+    def __init__(self, url, directory=SNAPSHOT_DIR):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        self.url = url
+        self.base_path = os.path.join(directory, key)
+        self.meta_path = self.base_path + ".json"
+        self.index_path = self.base_path + ".indexes.pkl"
+
+    def load(self):
+        """Mengembalikan (df, metadata) dari disk, atau (None, None) jika tidak ada atau rusak."""
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("url") != self.url:
+                return None, None
+            data_path = f"{self.base_path}.{meta['format']}"
+            if meta["format"] == "parquet":
+                df = pd.read_parquet(data_path, memory_map=True)
+            else:
+                df = pd.read_pickle(data_path)
+            return df, meta
+        except FileNotFoundError:
+            return None, None
+        except Exception as e:
+            logger.warning(f"Snapshot database di disk tidak dapat dibaca: {e}")
+            return None, None
+
+    def load_indexes(self, df, content_hash):
+        """(index, names, structured) milik snapshot `content_hash`, atau None jika tidak ada atau usang."""
+        try:
+            with open(self.index_path, "rb") as f:
+                stored = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Indeks database di disk tidak dapat dibaca: {e}")
+            return None
+        if stored.get("format") != INDEX_FORMAT_VERSION or stored.get("content_hash") != content_hash:
+            return None
+        structured = stored["structured"]
+        if structured is not None:
+            structured.attach(df)
+        return stored["index"], stored["names"], structured
+
+    def save_indexes(self, content_hash, index, names, structured):
+        stored = {
+            "format": INDEX_FORMAT_VERSION,
+            "content_hash": content_hash,
+            "index": index,
+            "names": names,
+            "structured": structured,
+        }
+        with open(self.index_path + ".tmp", "wb") as f:
+            pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def save(self, df, content_hash, etag=None, last_modified=None, indexes=None):
+        """Menyimpan DataFrame, lalu indeksnya (jika ada), lalu metadata sebagai penanda snapshot lengkap."""
+        os.makedirs(os.path.dirname(self.base_path), exist_ok=True)
+        try:
+            file_format = "parquet"
+            tmp_path = f"{self.base_path}.{file_format}.tmp"
+            df.to_parquet(tmp_path, index=False)
+        except Exception:
+            # Kolom dengan tipe campuran dari Excel tidak selalu bisa ditulis ke Parquet
+            file_format = "pkl"
+            tmp_path = f"{self.base_path}.{file_format}.tmp"
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, f"{self.base_path}.{file_format}")
+        if indexes is not None:
+            try:
+                self.save_indexes(content_hash, *indexes)
+            except Exception as e:
+                logger.warning(f"Gagal menyimpan indeks database ke disk: {e}")
+        self._write_meta(file_format, content_hash, etag, last_modified)
+
+    def save_meta(self, content_hash, etag=None, last_modified=None):
+        """Hanya memperbarui etag/last_modified bila data di disk sudah milik `content_hash`.
+
+        Mengembalikan False jika snapshot di disk tidak ada atau berisi data lain (perlu `save` penuh).
+        """
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("content_hash") != content_hash:
+            return False
+        self._write_meta(meta["format"], content_hash, etag, last_modified)
+        return True
+
+    def _write_meta(self, file_format, content_hash, etag, last_modified):
+        meta = {
+            "url": self.url,
+            "format": file_format,
+            "content_hash": content_hash,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+
+class DatabaseCache:
+    """Menyimpan satu salinan database per sumber dan menyegarkannya hanya jika sumber berubah.
+
+    `source` berupa URL/path spreadsheet, FileSource, atau SqliteSource. Pembaca cukup
+    mengambil `cache.snapshot`; penggantian snapshot dilakukan dengan satu penugasan
+    atribut sehingga pembaca tidak pernah melihat data setengah jadi.
+    """
+
+    def __init__(self, source, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.source = FileSource(source) if isinstance(source, str) else source
+        self.url = self.source.key
+        self.refresh_interval = refresh_interval
+        self.snapshot = EMPTY_SNAPSHOT
+        self.store = SnapshotStore(self.url)
+        self._listeners = []
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Memeriksa perubahan sumber data dan mengganti snapshot jika ada data baru.
+
+        Mengembalikan True jika snapshot diganti.
+        """
+        with self._refresh_lock:
+            current = self.snapshot
+            trace = start_trace("spreadsheet_load")
+            try:
+                with trace.stage("fetch"):
+                    result = self.source.fetch(current)
+                if result is None:
+                    logger.info(f"Sumber {self.url} tidak berubah, snapshot tetap dipakai.")
+                    trace.finish("not_modified")
+                    return False
+                payload, etag, last_modified = result
+                content_hash = self.source.content_hash(payload)
+                if current.df is not None and content_hash == current.content_hash:
+                    logger.info(f"Isi sumber {self.url} sama dengan snapshot, parsing dilewati.")
+                    self.snapshot = DatabaseSnapshot(
+                        current.df, current.index, current.version, etag, last_modified, content_hash,
+                        structured=current.structured, names=current.names,
+                    )
+                    try:
+                        # Data di disk sudah sama; cukup metadata validasi yang diperbarui
+                        if not self.store.save_meta(content_hash, etag, last_modified):
+                            self.store.save(
+                                current.df, content_hash, etag, last_modified,
+                                indexes=(current.index, current.names, current.structured),
+                            )
+                    except Exception as e:
+                        logger.warning(f"Gagal menyimpan metadata snapshot database ke disk: {e}")
+                    trace.finish("unchanged")
+                    return False
+                with trace.stage("parse"):
+                    df = self.source.parse(payload)
+                with trace.stage("index"):
+                    index = build_search_index(df)
+                    names = build_name_index(df)
+                    structured = build_structured_index(df, names)
+            except Exception as e:
+                logger.error(f"Error memuat sumber data {self.url}: {e}")
+                trace.finish("error")
+                return False
+            try:
+                with trace.stage("save"):
+                    self.store.save(df, content_hash, etag, last_modified, indexes=(index, names, structured))
+            except Exception as e:
+                logger.warning(f"Gagal menyimpan snapshot database ke disk: {e}")
+            trace.set(rows=len(df))
+            trace.finish("loaded")
+            self.snapshot = DatabaseSnapshot(
+                df, index, current.version + 1, etag, last_modified, content_hash, structured=structured, names=names
+            )
+            logger.info(f"Database {self.url} berhasil dimuat ({len(df)} baris, versi {current.version + 1}).")
+            self._notify(self.snapshot)
+            return True
+
+    def add_listener(self, callback):
+        """Mendaftarkan fungsi `callback(snapshot)` yang dipanggil setiap kali snapshot diganti."""
+        self._listeners.append(callback)
+
+    def _notify(self, snapshot):
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Error pada listener pembaruan database: {e}")
+
+    def load_from_disk(self):
+        """Memuat snapshot dari disk tanpa parsing ulang sumber. Mengembalikan True jika berhasil."""
+        df, meta = self.store.load()
+        if df is None:
+            return False
+        content_hash = meta.get("content_hash")
+        indexes = self.store.load_indexes(df, content_hash)
+        if indexes is None:
+            names = build_name_index(df)
+            indexes = (build_search_index(df), names, build_structured_index(df, names))
+            try:
+                self.store.save_indexes(content_hash, *indexes)
+            except Exception as e:
+                logger.warning(f"Gagal menyimpan indeks database ke disk: {e}")
+        index, names, structured = indexes
+        self.snapshot = DatabaseSnapshot(
+            df, index, 1, meta.get("etag"), meta.get("last_modified"), content_hash,
+            structured=structured, names=names,
+        )
+        logger.info(f"Database dimuat dari snapshot disk ({len(df)} baris).")
+        return True
+
+    def _run(self, refresh_first):
+        if refresh_first:
+            self.refresh()
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
+
+    def start(self):
+        """Memuat data pertama kali (jika belum ada) lalu menjalankan penyegaran latar belakang.
+
+        Jika snapshot disk tersedia, data langsung dipakai dan pengecekan ke sumber
+        dilakukan di latar belakang.
+        """
+        refresh_first = False
+        if self.snapshot.df is None:
+            if self.load_from_disk():
+                refresh_first = True
+            else:
+                self.refresh()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(refresh_first,), name="database-refresh", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_database_cache(url, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """Mengembalikan cache database bersama untuk `url`, dibuat dan dijalankan sekali per proses.
+
+    Untuk beberapa sheet atau sumber sekaligus, lihat data_sources.get_data_sources.
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(url)
+        if cache is None:
+            cache = DatabaseCache(url, refresh_interval)
+            # Jawaban yang dibuat dari versi database lama tidak boleh dipakai lagi
+            cache.add_listener(lambda snapshot: get_response_cache().invalidate_db_versions(snapshot.version))
+            _CACHES[url] = cache.start()
+    return cache
@@ -0,0 +1,164 @@
+# Modul pencarian database pelanggan B2B yang dipakai bersama oleh proyek.py dan telegram_bot.py
+import heapq
+import logging
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+import pandas as pd
+
+from context_packer import DEFAULT_CONTEXT_TOKENS, get_context_budget, pack_context
+
+logger = logging.getLogger(__name__)
+
+# Pola token: deretan huruf/angka, sehingga tanda baca seperti "PT." atau "(Persero)" tidak ikut
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Memecah teks menjadi token huruf kecil."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+# Kata umum Bahasa Indonesia yang hampir selalu muncul dan tidak membedakan pelanggan
+STOPWORDS = frozenset("""
+ada adalah agar akan aku anda apa apakah atau bagaimana bahwa banyak belum berapa bisa boleh
+buat dalam dan dari dengan di dia ini itu juga jika kah kami kamu kapan ke kenapa ketika lagi
+mana mau mereka mohon nya oleh pada para saja saya sebagai sedang semua siapa sudah tentang
+tersebut tidak tolong untuk yang info informasi cari carikan tampilkan berikan lihat
+""".split())
+
+# Bentuk badan usaha yang muncul di hampir semua nama pelanggan sehingga tidak membedakan baris
+LEGAL_SUFFIXES = frozenset(["pt", "tbk", "persero", "cv", "ud", "pd", "perum", "perseroan", "terbatas"])
+
+# Parameter BM25 dan batas jumlah baris yang dikirim ke LLM
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_MATCH_WEIGHT = 0.5
+# Kata kunci yang lebih pendek dari ini hanya dicocokkan persis (mis. "4" tidak meluas ke semua NIPNAS berawalan 4)
+MIN_PARTIAL_KEYWORD_LENGTH = 3
+TOP_K_ROWS = 20
+
+
+def extract_keywords(prompt):
+    """Mengambil kata kunci unik dari pertanyaan, tanpa stopword."""
+    keywords = []
+    for token in tokenize(prompt):
+        if token not in STOPWORDS and token not in LEGAL_SUFFIXES and token not in keywords:
+            keywords.append(token)
+    return keywords
+
+
+class InvertedIndex:
+    """Indeks terbalik token -> nomor baris yang dibangun sekali saat database dimuat."""
+
+    def __init__(self, df):
+        postings = defaultdict(lambda: defaultdict(int))
+        row_lengths = [0] * len(df)
+        for column in df.columns:
+            values = df[column]
+            # Tokenisasi cukup sekali per nilai unik di setiap kolom
+            codes, uniques = pd.factorize(values)
+            tokens_per_unique = [tokenize(value) for value in uniques]
+            for row_id, code in enumerate(codes):
+                if code < 0:
+                    continue  # sel kosong (NaN) tidak diindeks
+                tokens = tokens_per_unique[code]
+                row_lengths[row_id] += len(tokens)
+                for token in tokens:
+                    postings[token][row_id] += 1
+        self.postings = {token: dict(rows) for token, rows in postings.items()}
+        self.search_text = build_search_text(df)
+        self.vocabulary = sorted(self.postings)
+        self.row_lengths = row_lengths
+        self.num_rows = len(df)
+        self.avg_row_length = (sum(row_lengths) / self.num_rows) if self.num_rows else 0.0
+
+    def expand(self, keyword):
+        """Mengembalikan semua token di kosakata yang diawali `keyword` (pencocokan prefiks)."""
+        if len(keyword) < MIN_PARTIAL_KEYWORD_LENGTH:
+            return [keyword] if keyword in self.postings else []
+        start = bisect_left(self.vocabulary, keyword)
+        matches = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(keyword):
+                break
+            matches.append(token)
+        return matches
+
+    def idf(self, token):
+        doc_freq = len(self.postings.get(token, ()))
+        return math.log(1 + (self.num_rows - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def substring_search(self, keywords, top_k=TOP_K_ROWS):
+        """Baris yang memuat kata kunci sebagai potongan kata (mis. "komsel" di "telkomsel").
+
+        Dipakai bila pencarian token tidak menemukan apa pun; bekerja langsung pada kolom
+        teks huruf kecil yang sudah disiapkan, tanpa menyalin tabel per pertanyaan.
+        """
+        scores = defaultdict(int)
+        for keyword in set(keywords):
+            if len(keyword) < MIN_PARTIAL_KEYWORD_LENGTH:
+                continue
+            for row_id in self.search_text.str.contains(keyword, regex=False).to_numpy().nonzero()[0]:
+                scores[int(row_id)] += 1
+        return heapq.nsmallest(top_k, scores, key=lambda row_id: (-scores[row_id], row_id))
+
+    def search(self, keywords, top_k=TOP_K_ROWS):
+        """Mengembalikan nomor baris dengan skor BM25 tertinggi, maksimal `top_k` baris."""
+        scores = defaultdict(float)
+        for keyword in set(keywords):
+            for token in self.expand(keyword):
+                weight = self.idf(token) * (1.0 if token == keyword else PREFIX_MATCH_WEIGHT)
+                for row_id, term_freq in self.postings[token].items():
+                    norm = 1 - BM25_B + BM25_B * self.row_lengths[row_id] / self.avg_row_length
+                    scores[row_id] += weight * term_freq * (BM25_K1 + 1) / (term_freq + BM25_K1 * norm)
+        if top_k is None:
+            return sorted(scores, key=lambda row_id: (-scores[row_id], row_id))
+        return heapq.nsmallest(top_k, scores, key=lambda row_id: (-scores[row_id], row_id))
+
+
+def build_search_text(df):
+    """Satu kolom teks huruf kecil per baris (gabungan semua kolom), dibuat sekali saat database dimuat."""
+    search_text = pd.Series("", index=range(len(df)), dtype=object)
+    for column in df.columns:
+        # map pada categorical hanya memproses nilai uniknya
+        text = df[column].map(lambda value: "" if pd.isna(value) else str(value).lower())
+        search_text = search_text + " | " + text.astype(str).to_numpy()
+    return search_text
+
+
+def build_search_index(df):
+    """Membangun indeks pencarian untuk DataFrame; None jika database tidak dimuat."""
+    if df is None or df.empty:
+        return None
+    return InvertedIndex(df)
+
+
+NO_MATCH_MESSAGE = "Tidak ada data spesifik yang ditemukan untuk permintaan Anda di database."
+
+
+def find_relevant_context(prompt, df, index=None, top_k=TOP_K_ROWS, model=None, name_index=None, token_budget=None):
+    if df is None or df.empty:
+        return "Database tidak dimuat atau kosong."
+    if index is None:
+        index = build_search_index(df)
+    keywords = extract_keywords(prompt)
+    row_ids = index.search(keywords, top_k=top_k)
+    if not row_ids:
+        row_ids = index.substring_search(keywords, top_k=top_k)
+    if name_index is not None:
+        # Baris dari nama pelanggan yang cocok secara fuzzy (salah ketik, singkatan) didahulukan
+        name_rows = name_index.search_rows(prompt)
+        row_ids = list(dict.fromkeys(name_rows + list(row_ids)))[:top_k]
+    relevant_df = df.iloc[row_ids]
+    if relevant_df.empty:
+        return NO_MATCH_MESSAGE
+    if token_budget is None:
+        token_budget = get_context_budget(model) if model else DEFAULT_CONTEXT_TOKENS
+    context, truncated = pack_context(relevant_df, keywords, token_budget)
+    if truncated:
+        logger.info(f"Konteks dipotong: {truncated} dari {len(relevant_df)} baris tidak dikirim.")
+        context += f"\n({truncated} baris lain yang cocok tidak ditampilkan karena batas ukuran konteks.)"
+    return context
@@ -0,0 +1,191 @@
+# Server Bot API Telegram palsu untuk menguji telegram_bot.py mode webhook secara lokal (tanpa jaringan)
+#
+# Contoh, dua worker di belakang satu store bersama (server menunggu kedua worker memanggil setWebhook):
+#   python fake_telegram.py --port 8081 --webhooks http://127.0.0.1:8443/telegram,http://127.0.0.1:8444/telegram \
+#       --messages "/start" "Buat SPH" "PT Maju Jaya" "Jl. Sudirman 1" "Astinet 100 Mbps" "Rp 5.000.000" "-" &
+#   export TELEGRAM_BOT_TOKEN=123:test TELEGRAM_API_BASE_URL=http://127.0.0.1:8081
+#   TELEGRAM_WEBHOOK_URL=http://127.0.0.1:8443/telegram TELEGRAM_WEBHOOK_PORT=8443 python telegram_bot.py &
+#   TELEGRAM_WEBHOOK_URL=http://127.0.0.1:8444/telegram TELEGRAM_WEBHOOK_PORT=8444 python telegram_bot.py &
+# Setiap pesan dikirim bergantian ke worker berikutnya, jadi percakapan SPH hanya selesai jika state-nya dibagi.
+# Skenario yang sama dijalankan otomatis (dua Application dalam satu proses) oleh tests/test_telegram_webhook.py.
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "ASKARINA", "username": "askarina_test_bot"}
+TEST_USER = {"id": 42, "is_bot": False, "first_name": "Penguji"}
+REPLY_TIMEOUT = 60
+
+
+class FakeTelegramState:
+    """Panggilan Bot API yang diterima server, dipakai untuk menunggu balasan bot."""
+
+    def __init__(self):
+        self.calls = []
+        self.message_ids = itertools.count(1)
+        self.condition = threading.Condition()
+
+    def record(self, method, params):
+        with self.condition:
+            self.calls.append((method, params))
+            self.condition.notify_all()
+
+    def wait_for_method(self, method, count, timeout=REPLY_TIMEOUT):
+        """Menunggu sampai `method` dipanggil minimal `count` kali; True jika tercapai."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while sum(1 for name, _ in self.calls if name.lower() == method.lower()) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def wait_for_calls(self, start, idle_seconds=1.5, timeout=REPLY_TIMEOUT):
+        """Panggilan sejak indeks `start`, setelah bot diam selama `idle_seconds`."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while time.monotonic() < deadline:
+                count = len(self.calls)
+                self.condition.wait(idle_seconds)
+                if len(self.calls) == count and count > start:
+                    break
+            return self.calls[start:]
+
+
+def parse_params(handler):
+    length = int(handler.headers.get("Content-Length") or 0)
+    body = handler.rfile.read(length) if length else b""
+    content_type = handler.headers.get("Content-Type", "")
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()}
+    # multipart (sendDocument): isi file tidak diperlukan untuk pengujian
+    return {"multipart_bytes": len(body)}
+
+
+def api_result(state, method, params):
+    lowered = method.lower()
+    if lowered == "getme":
+        return BOT_USER
+    if lowered == "getupdates":
+        return []
+    if lowered == "getwebhookinfo":
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+    if lowered.startswith(("send", "edit")):
+        chat_id = int(params.get("chat_id") or TEST_USER["id"])
+        message_id = int(params.get("message_id") or next(state.message_ids))
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+    return True
+
+
+def make_handler(state):
+    class FakeTelegramHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            # Path berbentuk /bot<token>/<method>
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            params = parse_params(self)
+            state.record(method, params)
+            body = json.dumps({"ok": True, "result": api_result(state, method, params)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return FakeTelegramHandler
+
+
+def start_fake_telegram(host="127.0.0.1", port=8081):
+    """Menjalankan server palsu di thread latar belakang; mengembalikan (server, state)."""
+    state = FakeTelegramState()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def make_update(update_id, text, user=TEST_USER):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def post_update(webhook_url, update, secret_token=None):
+    request = urllib.request.Request(
+        webhook_url, data=json.dumps(update).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    if secret_token:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret_token)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Bot API Telegram palsu untuk menguji mode webhook")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--webhooks", default="", help="URL webhook worker, dipisah koma; dikirimi pesan bergantian")
+    parser.add_argument("--messages", nargs="*", default=[], help="teks pesan pengguna yang dikirim berurutan")
+    parser.add_argument("--secret-token", default="")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server, state = start_fake_telegram(args.host, args.port)
+    print(f"Bot API palsu berjalan di http://{args.host}:{args.port}")
+    if not args.messages:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    webhook_urls = [url for url in args.webhooks.split(",") if url]
+    if not webhook_urls:
+        parser.error("--messages membutuhkan --webhooks")
+    print(f"Menunggu {len(webhook_urls)} worker mendaftarkan webhook...")
+    if not state.wait_for_method("setWebhook", len(webhook_urls)):
+        print("Tidak semua worker mendaftarkan webhook; pesan tetap dikirim.")
+    time.sleep(1)  # server webhook baru mendengarkan sesaat setelah setWebhook
+    webhooks = itertools.cycle(webhook_urls)
+    for update_id, text in enumerate(args.messages, start=1):
+        webhook_url = next(webhooks)
+        start = len(state.calls)
+        post_update(webhook_url, make_update(update_id, text), args.secret_token or None)
+        print(f"\n> {text}   ({webhook_url})")
+        for method, params in state.wait_for_calls(start):
+            if params.get("text"):
+                print(f"< [{method}] {params['text']}")
+            else:
+                print(f"< [{method}]")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
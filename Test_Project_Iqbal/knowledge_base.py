@@ -0,0 +1,111 @@
+# Indeks pencarian potongan (chunk) dokumen PDF untuk basis pengetahuan coba.py
+import heapq
+import math
+import os
+from collections import Counter, defaultdict
+
+from database_search import BM25_B, BM25_K1, STOPWORDS, tokenize
+from response_cache import load_local_embedder
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP_WORDS = 40
+TOP_K_CHUNKS = 5
+# Model sentence-transformers lokal untuk indeks vektor opsional; kosong = hanya indeks leksikal
+KNOWLEDGE_EMBEDDING_MODEL = os.getenv("KNOWLEDGE_EMBEDDING_MODEL", "")
+
+
+def load_knowledge_embedder():
+    return load_local_embedder(KNOWLEDGE_EMBEDDING_MODEL)
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap_words=CHUNK_OVERLAP_WORDS):
+    """Memecah teks menjadi potongan sekitar `chunk_words` kata yang saling tumpang tindih."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap_words, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class KnowledgeIndex:
+    """Indeks leksikal BM25 (dan opsional vektor) atas potongan dokumen yang diunggah."""
+
+    def __init__(self, embedder=None):
+        self.embedder = embedder
+        self.chunks = []  # daftar (nama_dokumen, teks)
+        self.vectors = []
+        self.postings = defaultdict(dict)
+        self.chunk_lengths = []
+        self.documents = {}  # nama_dokumen -> jumlah kata
+        self.content_hashes = set()  # hash isi file yang sudah diindeks
+
+    @property
+    def word_count(self):
+        return sum(self.documents.values())
+
+    def add_document(self, name, text, content_hash=None):
+        """Memotong dan mengindeks satu dokumen. Mengembalikan jumlah potongan yang ditambahkan."""
+        if content_hash is not None:
+            self.content_hashes.add(content_hash)
+        added = 0
+        for chunk in chunk_text(text):
+            chunk_id = len(self.chunks)
+            tokens = [token for token in tokenize(chunk) if token not in STOPWORDS]
+            for token, term_freq in Counter(tokens).items():
+                self.postings[token][chunk_id] = term_freq
+            self.chunks.append((name, chunk))
+            self.chunk_lengths.append(len(tokens))
+            if self.embedder is not None:
+                self.vectors.append(self.embedder(chunk))
+            added += 1
+        self.documents[name] = self.documents.get(name, 0) + len(text.split())
+        return added
+
+    def _bm25_scores(self, query):
+        scores = defaultdict(float)
+        num_chunks = len(self.chunks)
+        avg_length = (sum(self.chunk_lengths) / num_chunks) or 1.0
+        for token in set(tokenize(query)) - STOPWORDS:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, term_freq in postings.items():
+                norm = 1 - BM25_B + BM25_B * self.chunk_lengths[chunk_id] / avg_length
+                scores[chunk_id] += idf * term_freq * (BM25_K1 + 1) / (term_freq + BM25_K1 * norm)
+        return scores
+
+    def _vector_scores(self, query):
+        query_vector = self.embedder(query)
+        query_norm = math.sqrt(sum(x * x for x in query_vector)) or 1.0
+        scores = {}
+        for chunk_id, vector in enumerate(self.vectors):
+            norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+            scores[chunk_id] = sum(x * y for x, y in zip(query_vector, vector)) / (query_norm * norm)
+        return scores
+
+    def search(self, query, top_k=TOP_K_CHUNKS):
+        """Mengembalikan daftar (nama_dokumen, teks) dengan skor tertinggi untuk pertanyaan."""
+        if not self.chunks:
+            return []
+        scores = self._bm25_scores(query)
+        if self.embedder is not None and self.vectors:
+            # Gabungkan peringkat leksikal dan vektor dengan reciprocal rank fusion
+            fused = defaultdict(float)
+            for ranking in (scores, self._vector_scores(query)):
+                ordered = sorted(ranking, key=ranking.get, reverse=True)
+                for rank, chunk_id in enumerate(ordered):
+                    fused[chunk_id] += 1.0 / (60 + rank)
+            scores = fused
+        best = heapq.nlargest(top_k, scores, key=scores.get)
+        return [self.chunks[chunk_id] for chunk_id in best]
+
+
+def format_chunks(chunks):
+    """Menyusun potongan terpilih beserta nama dokumennya untuk disisipkan ke prompt."""
+    return "\n\n".join(f"=== DOCUMENT: {name} ===\n{text}" for name, text in chunks)
@@ -0,0 +1,135 @@
+# Registry klien LLM yang dipakai bersama oleh main.py, coba.py, proyek.py dan telegram_bot.py
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TELKOM_BASE_URL = os.getenv("TELKOM_BASE_URL", "https://telkom-ai-dag-api.apilogy.id/Telkom-LLM/0.0.4/llm")
+DEFAULT_GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Endpoint Gemini alternatif (misalnya server palsu lokal untuk pengujian); kosong = endpoint Google
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+# Batas waktu dan percobaan ulang untuk semua panggilan LLM
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Ukuran pool koneksi HTTP keep-alive per klien
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+
+
+def _http_timeout():
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _http_limits():
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE)
+
+
+class ProviderRegistry:
+    """Membuat klien setiap penyedia sekali saat pertama dibutuhkan, lalu memakainya ulang."""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._gemini_configured = False
+
+    def _get_or_create(self, key, factory):
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = factory()
+                    self._clients[key] = client
+        return client
+
+    def telkom(self):
+        """Klien OpenAI sinkron untuk Telkom LLM, atau None jika TELKOM_API_KEY tidak ada."""
+        api_key = os.getenv("TELKOM_API_KEY")
+        if not api_key:
+            return None
+
+        def factory():
+            from openai import OpenAI
+            return OpenAI(
+                api_key=api_key,
+                base_url=TELKOM_BASE_URL,
+                default_headers={"x-api-key": api_key},
+                timeout=_http_timeout(),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=httpx.Client(limits=_http_limits(), timeout=_http_timeout()),
+            )
+        return self._get_or_create("telkom", factory)
+
+    def telkom_async(self):
+        """Klien AsyncOpenAI untuk Telkom LLM, atau None jika TELKOM_API_KEY tidak ada."""
+        api_key = os.getenv("TELKOM_API_KEY")
+        if not api_key:
+            return None
+
+        def factory():
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(
+                api_key=api_key,
+                base_url=TELKOM_BASE_URL,
+                default_headers={"x-api-key": api_key},
+                timeout=_http_timeout(),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout()),
+            )
+        return self._get_or_create("telkom_async", factory)
+
+    def gemini(self, model_name=DEFAULT_GEMINI_MODEL):
+        """Objek GenerativeModel untuk `model_name`, atau None jika GEMINI_API_KEY tidak ada."""
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return None
+
+        def factory():
+            import google.generativeai as genai
+            if not self._gemini_configured:
+                # genai.configure cukup sekali per proses; klien gRPC di dalamnya dipakai ulang
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=api_key)
+                self._gemini_configured = True
+            return genai.GenerativeModel(model_name)
+        return self._get_or_create(("gemini", model_name), factory)
+
+
+def gemini_request_options(stream=False, is_async=False):
+    """Opsi timeout dan retry (dengan backoff eksponensial) untuk panggilan Gemini."""
+    if stream:
+        # Respons streaming tidak diulang otomatis agar potongan tidak terkirim dua kali
+        return {"timeout": LLM_TIMEOUT}
+    if is_async:
+        from google.api_core.retry_async import AsyncRetry as Retry
+    else:
+        from google.api_core.retry import Retry
+    return {
+        "timeout": LLM_TIMEOUT,
+        "retry": Retry(initial=1.0, maximum=10.0, multiplier=2.0, timeout=LLM_TIMEOUT * (LLM_MAX_RETRIES + 1)),
+    }
+
+
+_REGISTRY = ProviderRegistry()
+
+
+def get_registry():
+    return _REGISTRY
+
+
+def get_telkom_client():
+    return _REGISTRY.telkom()
+
+
+def get_async_telkom_client():
+    return _REGISTRY.telkom_async()
+
+
+def get_gemini_model(model_name=DEFAULT_GEMINI_MODEL):
+    return _REGISTRY.gemini(model_name)
@@ -1,24 +1,20 @@
 import streamlit as st
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from llm_clients import gemini_request_options, get_gemini_model
+
 # Muat environment variables dari file .env
 load_dotenv()
 
-# Konfigurasi API key Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
 st.title("My First AI Chatbot")
 
-# Inisialisasi model
-model = genai.GenerativeModel('gemini-2.5-pro')
-
 # Input chat dari pengguna
 if prompt := st.chat_input("Tanya sesuatu..."):
     st.chat_message("user").markdown(prompt)
 
-    response = model.generate_content(prompt)
+    # Model diambil dari registry bersama, hanya dibuat saat pertama kali dipakai
+    model = get_gemini_model('gemini-2.5-pro')
+    response = model.generate_content(prompt, request_options=gemini_request_options())
 
     with st.chat_message("assistant"):
         st.markdown(response.text)
@@ -0,0 +1,164 @@
+# Pencatatan latensi dan token per permintaan (tahap pencarian, LLM, render) ke JSONL dan/atau Prometheus
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from context_packer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# File JSONL tujuan; kosong = tidak ditulis
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")
+# Port endpoint /metrics Prometheus (butuh paket prometheus_client); kosong = tidak dijalankan
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+
+class PrometheusSink:
+    """Histogram dan counter Prometheus; hanya aktif bila prometheus_client terpasang."""
+
+    def __init__(self, port):
+        from prometheus_client import Counter, Histogram, start_http_server
+
+        self.stage_seconds = Histogram(
+            "askarina_stage_seconds", "Durasi setiap tahap permintaan",
+            ["kind", "stage", "mode", "provider"], buckets=LATENCY_BUCKETS,
+        )
+        self.request_seconds = Histogram(
+            "askarina_request_seconds", "Durasi total permintaan",
+            ["kind", "mode", "provider", "status"], buckets=LATENCY_BUCKETS,
+        )
+        self.ttft_seconds = Histogram(
+            "askarina_ttft_seconds", "Waktu sampai token pertama",
+            ["kind", "mode", "provider"], buckets=LATENCY_BUCKETS,
+        )
+        self.tokens = Counter("askarina_tokens_total", "Perkiraan token masuk/keluar", ["kind", "mode", "provider", "direction"])
+        start_http_server(int(port))
+        logger.info(f"Endpoint metrik Prometheus aktif di port {port}.")
+
+    def record(self, record):
+        labels = {"kind": record["kind"], "mode": record["mode"], "provider": record["provider"] or "-"}
+        for stage, seconds in record["stages"].items():
+            self.stage_seconds.labels(stage=stage, **labels).observe(seconds)
+        self.request_seconds.labels(status=record["status"], **labels).observe(record["total_seconds"])
+        if record.get("ttft_seconds") is not None:
+            self.ttft_seconds.labels(**labels).observe(record["ttft_seconds"])
+        for direction in ("in", "out"):
+            if record.get(f"tokens_{direction}"):
+                self.tokens.labels(direction=direction, **labels).inc(record[f"tokens_{direction}"])
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class MetricsRecorder:
+    """Meneruskan catatan permintaan yang selesai ke semua sink yang dikonfigurasi."""
+
+    def __init__(self, jsonl_path=METRICS_JSONL_PATH, port=METRICS_PORT):
+        self.sinks = []
+        if jsonl_path:
+            self.sinks.append(JsonlSink(jsonl_path))
+        if port:
+            try:
+                self.sinks.append(PrometheusSink(port))
+            except ImportError:
+                logger.warning("METRICS_PORT diatur tetapi prometheus_client tidak terpasang; endpoint tidak dijalankan.")
+            except OSError as e:
+                # Proses lain (mis. rerun Streamlit) sudah memakai port ini
+                logger.warning(f"Endpoint metrik Prometheus tidak dapat dijalankan di port {port}: {e}")
+
+    def record(self, record):
+        stages = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in record["stages"].items())
+        logger.info(
+            f"[metrik] {record['kind']} mode={record['mode']} provider={record['provider']} status={record['status']} "
+            f"total={record['total_seconds'] * 1000:.0f}ms {stages}"
+        )
+        for sink in self.sinks:
+            try:
+                sink.record(record)
+            except Exception as e:
+                logger.error(f"Gagal menulis metrik ke {type(sink).__name__}: {e}")
+
+
+class RequestTrace:
+    """Mengukur satu permintaan: durasi per tahap, TTFT, token, serta penyedia yang menjawab."""
+
+    def __init__(self, recorder, kind, mode, frontend):
+        self.recorder = recorder
+        self.started = time.monotonic()
+        self.stages = {}
+        self.fields = {
+            "kind": kind, "mode": mode, "frontend": frontend, "provider": None, "model": None,
+            "ttft_seconds": None, "tokens_in": None, "tokens_out": None,
+        }
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.monotonic() - started)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def prompt(self, messages):
+        """Mencatat perkiraan token masuk dari daftar pesan format OpenAI."""
+        self.fields["tokens_in"] = sum(estimate_tokens(message["content"]) for message in messages)
+
+    def routed(self, route_info):
+        """Menyalin penyedia, model, dan TTFT dari `route_info` milik ProviderRouter."""
+        for key in ("provider", "model", "ttft_seconds"):
+            if route_info.get(key) is not None:
+                self.fields[key] = route_info[key]
+
+    def finish(self, status="ok", response_text=None):
+        if self._finished:
+            return
+        self._finished = True
+        if response_text is not None:
+            self.fields["tokens_out"] = estimate_tokens(response_text)
+        record = dict(self.fields)
+        record.update({
+            "timestamp": time.time(),
+            "status": status,
+            "total_seconds": time.monotonic() - self.started,
+            "stages": self.stages,
+        })
+        self.recorder.record(record)
+
+
+_RECORDER = None
+_RECORDER_LOCK = threading.Lock()
+
+
+def get_metrics():
+    """Mengembalikan perekam metrik bersama untuk proses ini."""
+    global _RECORDER
+    with _RECORDER_LOCK:
+        if _RECORDER is None:
+            _RECORDER = MetricsRecorder()
+    return _RECORDER
+
+
+def start_trace(kind, mode="-", frontend="-"):
+    return RequestTrace(get_metrics(), kind, mode, frontend)
+
@@ -0,0 +1,196 @@
+# Indeks nama pelanggan yang toleran salah ketik (trigram per kata + singkatan) untuk database_search
+import heapq
+import math
+import re
+from collections import defaultdict, namedtuple
+
+import pandas as pd
+
+from context_packer import is_empty
+from database_search import LEGAL_SUFFIXES, STOPWORDS, tokenize
+
+# Kata kunci judul kolom yang berisi nama (pelanggan, perusahaan, AM, dll.)
+NAME_COLUMN_KEYWORDS = ["nama", "pelanggan", "customer", "perusahaan", "company"]
+MIN_TOKEN_SIMILARITY = 0.6
+MIN_NAME_SCORE = 0.5
+TOP_K_NAMES = 5
+MIN_QUERY_TOKEN_LENGTH = 3
+MIN_ACRONYM_LENGTH = 3
+# Kata nama yang sangat umum tidak dipakai untuk memunculkan kandidat, hanya untuk menambah skor
+MAX_CANDIDATE_POSTINGS = 500
+
+# Isi tanda kurung pada nama, mis. "Telekomunikasi Selular (Telkomsel)"
+PARENTHESES_PATTERN = re.compile(r"\(([^)]*)\)")
+
+NameMatch = namedtuple("NameMatch", ["name", "column", "score", "rows", "query_tokens"])
+
+
+def normalize_name(text):
+    """Token nama tanpa bentuk badan usaha seperti PT, CV, atau Tbk."""
+    return tuple(token for token in tokenize(text) if token not in LEGAL_SUFFIXES)
+
+
+def name_variants(text):
+    """Nama utama dan nama alternatif di dalam tanda kurung, masing-masing sebagai token nama."""
+    text = str(text)
+    variants = [normalize_name(PARENTHESES_PATTERN.sub(" ", text))]
+    variants += [normalize_name(alias) for alias in PARENTHESES_PATTERN.findall(text)]
+    return list(dict.fromkeys(variant for variant in variants if variant))
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def find_name_columns(df):
+    columns = []
+    for column in df.columns:
+        header = " ".join(tokenize(column))
+        if any(keyword in header for keyword in NAME_COLUMN_KEYWORDS) and not pd.api.types.is_numeric_dtype(df[column]):
+            columns.append(column)
+    return columns
+
+
+class NameIndex:
+    """Indeks trigram atas kata-kata nama, dibangun sekali saat database dimuat.
+
+    Setiap kata di pertanyaan dicocokkan secara fuzzy ke kosakata nama (kemiripan Dice
+    trigram), lalu setiap nama diberi skor sebesar bobot IDF kata-katanya yang tercakup.
+    Singkatan nama (mis. "BRI" untuk "Bank Rakyat Indonesia") ikut diindeks.
+    """
+
+    def __init__(self, df, columns=None):
+        self.columns = find_name_columns(df) if columns is None else columns
+        self.entities = []  # daftar (nama_asli, kolom, token_nama)
+        self.entity_rows = []
+        entity_ids = {}
+        for column in self.columns:
+            for row_id, value in enumerate(df[column]):
+                if is_empty(value):
+                    continue
+                for tokens in name_variants(value):
+                    key = (column, tokens)
+                    entity_id = entity_ids.get(key)
+                    if entity_id is None:
+                        entity_id = entity_ids[key] = len(self.entities)
+                        self.entities.append((" ".join(str(value).split()), column, tokens))
+                        self.entity_rows.append([])
+                    self.entity_rows[entity_id].append(row_id)
+
+        token_entities = defaultdict(set)
+        self.acronyms = defaultdict(set)
+        for entity_id, (_, _, tokens) in enumerate(self.entities):
+            for token in tokens:
+                token_entities[token].add(entity_id)
+            if len(tokens) >= MIN_ACRONYM_LENGTH:
+                self.acronyms["".join(token[0] for token in tokens)].add(entity_id)
+        self.vocabulary = list(token_entities)
+        self.token_entities = [token_entities[token] for token in self.vocabulary]
+        self.token_ids = {token: token_id for token_id, token in enumerate(self.vocabulary)}
+        num_entities = max(len(self.entities), 1)
+        self.token_idf = {
+            token: math.log(1 + num_entities / len(token_entities[token])) for token in self.vocabulary
+        }
+        self.entity_weight = [sum(self.token_idf[token] for token in set(tokens)) for _, _, tokens in self.entities]
+
+        self.trigram_postings = defaultdict(list)
+        self.trigram_counts = []
+        for token_id, token in enumerate(self.vocabulary):
+            grams = trigrams(token)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigram_postings[gram].append(token_id)
+        self._similar_cache = {}
+
+    def similar_tokens(self, query_token):
+        """Kata di kosakata nama yang mirip `query_token`, sebagai dict kata -> kemiripan (0..1)."""
+        cached = self._similar_cache.get(query_token)
+        if cached is not None:
+            return cached
+        if query_token in self.token_ids:
+            similar = {query_token: 1.0}
+        else:
+            grams = trigrams(query_token)
+            overlaps = defaultdict(int)
+            for gram in grams:
+                for token_id in self.trigram_postings.get(gram, ()):
+                    overlaps[token_id] += 1
+            similar = {}
+            for token_id, overlap in overlaps.items():
+                score = 2 * overlap / (len(grams) + self.trigram_counts[token_id])
+                if score >= MIN_TOKEN_SIMILARITY:
+                    similar[self.vocabulary[token_id]] = score
+        if len(self._similar_cache) > 10000:
+            self._similar_cache.clear()
+        self._similar_cache[query_token] = similar
+        return similar
+
+    def search(self, text, top_k=TOP_K_NAMES, min_score=MIN_NAME_SCORE):
+        """Nama yang paling cocok dengan kata-kata di `text`, terurut dari skor tertinggi.
+
+        Satu baris bisa punya beberapa nama (utama dan alias); yang dikembalikan skor terbaiknya.
+        """
+        query_tokens = [
+            token for token in dict.fromkeys(tokenize(text))
+            if token not in STOPWORDS and token not in LEGAL_SUFFIXES
+        ]
+        # token_nama -> (kemiripan terbaik, kata pertanyaan yang cocok)
+        best = {}
+        exact_acronyms = defaultdict(set)
+        for query_token in query_tokens:
+            for entity_id in self.acronyms.get(query_token, ()):
+                exact_acronyms[entity_id].add(query_token)
+            if len(query_token) < MIN_QUERY_TOKEN_LENGTH and query_token not in self.token_ids:
+                continue
+            for token, similarity in self.similar_tokens(query_token).items():
+                if similarity > best.get(token, (0.0, None))[0]:
+                    best[token] = (similarity, query_token)
+
+        postings = sorted((self.token_entities[self.token_ids[token]] for token in best), key=len)
+        candidates = set()
+        for entities in postings:
+            if len(entities) > MAX_CANDIDATE_POSTINGS:
+                break
+            candidates |= entities
+        if not candidates and postings:
+            # Semua kata cocok bersifat umum: kandidat hanyalah nama yang memuat semuanya
+            candidates = set(postings[0]).intersection(*postings[1:])
+
+        scored = []
+        for entity_id in candidates | set(exact_acronyms):
+            name, column, tokens = self.entities[entity_id]
+            if entity_id in exact_acronyms:
+                score, matched = 1.0, exact_acronyms[entity_id]
+            else:
+                covered = sum(best[token][0] * self.token_idf[token] for token in set(tokens) if token in best)
+                score = covered / self.entity_weight[entity_id]
+                matched = {best[token][1] for token in tokens if token in best}
+            if score >= min_score:
+                scored.append((score, entity_id, matched))
+        matches = []
+        seen = set()
+        for score, entity_id, matched in heapq.nlargest(top_k * 2, scored, key=lambda item: (item[0], -item[1])):
+            name, column, _ = self.entities[entity_id]
+            if (name, column) in seen:
+                continue
+            seen.add((name, column))
+            matches.append(NameMatch(name, column, score, self.entity_rows[entity_id], matched))
+        return matches[:top_k]
+
+    def search_rows(self, text, top_k=TOP_K_NAMES):
+        """Nomor baris dari nama-nama yang cocok, tanpa duplikat dan sesuai urutan skor."""
+        rows = []
+        for match in self.search(text, top_k=top_k):
+            rows.extend(match.rows)
+        return list(dict.fromkeys(rows))
+
+
+def build_name_index(df):
+    """Membangun indeks nama fuzzy; None jika database tidak dimuat atau tidak punya kolom nama."""
+    if df is None or df.empty:
+        return None
+    columns = find_name_columns(df)
+    if not columns:
+        return None
+    return NameIndex(df, columns)
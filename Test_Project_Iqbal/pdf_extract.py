@@ -0,0 +1,124 @@
+# Ekstraksi teks PDF per rentang halaman yang bisa dijalankan paralel di process pool
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+from multiprocessing import shared_memory
+
+import PyPDF2
+
+PAGES_PER_TASK = 25
+# Di bawah jumlah halaman ini ekstraksi berurutan lebih cepat daripada membagi ke proses pekerja
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "100"))
+MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(os.cpu_count() or 2)))
+# Batas ekstraksi agar dokumen yang sangat besar tidak menahan aplikasi terlalu lama
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))
+MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "5000000"))
+
+
+def create_executor(max_workers=MAX_WORKERS):
+    # "spawn" dipakai agar proses pekerja tidak mewarisi thread milik Streamlit
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def count_pages(data):
+    return len(PyPDF2.PdfReader(BytesIO(data)).pages)
+
+
+def _page_texts(pages, start, stop):
+    return [(pages[i].extract_text() or "") for i in range(start, min(stop, len(pages)))]
+
+
+# Reader terakhir per proses pekerja: setiap pekerja mem-parsing dokumen yang sama sekali saja
+_worker_reader = (None, None)
+
+
+def extract_page_range(segment_name, size, start, stop):
+    """Mengekstrak teks halaman [start, stop) dari PDF di shared memory `segment_name` (`size` byte).
+
+    Mengembalikan daftar teks per halaman.
+    """
+    global _worker_reader
+    cached_name, reader = _worker_reader
+    if cached_name != segment_name:
+        segment = shared_memory.SharedMemory(name=segment_name)
+        try:
+            reader = PyPDF2.PdfReader(BytesIO(bytes(segment.buf[:size])))
+        finally:
+            segment.close()
+        _worker_reader = (segment_name, reader)
+    return _page_texts(reader.pages, start, stop)
+
+
+def extract_pdf_text(data, executor=None, on_progress=None, max_pages=MAX_PAGES, max_chars=MAX_CHARS):
+    """Mengekstrak teks PDF, paralel per rentang halaman jika `executor` diberikan.
+
+    Dokumen di bawah `PARALLEL_MIN_PAGES` halaman tetap diekstrak berurutan. Untuk ekstraksi
+    paralel, data disalin sekali ke shared memory dan pekerja hanya menerima nama segmennya.
+    `on_progress(halaman_selesai, total_halaman)` dipanggil setiap satu rentang selesai.
+    Ekstraksi berhenti lebih awal setelah `max_pages` halaman atau `max_chars` karakter.
+    """
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    total_pages = min(len(reader.pages), max_pages)
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages)) for start in range(0, total_pages, PAGES_PER_TASK)]
+    results = {}
+    done_pages = 0
+
+    if executor is None or len(ranges) <= 1 or total_pages < PARALLEL_MIN_PAGES:
+        chars = 0
+        for start, stop in ranges:
+            results[start] = _page_texts(reader.pages, start, stop)
+            done_pages += stop - start
+            chars += sum(len(page) for page in results[start])
+            if on_progress:
+                on_progress(done_pages, total_pages)
+            if chars >= max_chars:
+                break
+    else:
+        segment = shared_memory.SharedMemory(create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        try:
+            pending = {
+                executor.submit(extract_page_range, segment.name, len(data), start, stop): start
+                for start, stop in ranges
+            }
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start = pending.pop(future)
+                    results[start] = future.result()
+                    done_pages += len(results[start])
+                    if on_progress:
+                        on_progress(done_pages, total_pages)
+                if _prefix_chars(results, ranges) >= max_chars:
+                    # Rentang awal sudah cukup; sisa pekerjaan dibatalkan
+                    for future in pending:
+                        future.cancel()
+                    break
+        finally:
+            # Pekerja yang sudah memuat dokumen memegang salinannya sendiri; hasil tugas yang tertinggal diabaikan
+            segment.close()
+            segment.unlink()
+
+    # Gabungkan halaman sesuai urutan tanpa penyambungan string berulang
+    pages = []
+    chars = 0
+    for start, _ in ranges:
+        if start not in results:
+            break
+        for page in results[start]:
+            if chars >= max_chars:
+                break
+            pages.append(page)
+            chars += len(page)
+    return "\n".join(pages) + "\n"
+
+
+def _prefix_chars(results, ranges):
+    """Jumlah karakter dari rentang-rentang awal yang sudah selesai secara berurutan."""
+    chars = 0
+    for start, _ in ranges:
+        if start not in results:
+            break
+        chars += sum(len(page) for page in results[start])
+    return chars
@@ -0,0 +1,334 @@
+# Router penyedia LLM dengan failover berbasis latensi antara Telkom LLM dan Gemini
+import asyncio
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from admission import get_provider_limiter
+from llm_clients import LLM_TIMEOUT, get_async_telkom_client, get_gemini_model, get_telkom_client
+
+logger = logging.getLogger(__name__)
+
+# Batas waktu per panggilan (sampai token pertama) dan SLO latensi per penyedia (detik)
+CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "20"))
+LATENCY_SLO = float(os.getenv("LLM_LATENCY_SLO", "8"))
+MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.5"))
+STATS_WINDOW = 50
+# Penyedia baru dinilai setelah jendela berisi sekian sampel, agar satu-dua panggilan lambat tidak membuatnya turun
+MIN_SAMPLES = int(os.getenv("LLM_STATS_MIN_SAMPLES", "20"))
+# Lama penyedia yang bermasalah diturunkan prioritasnya sebelum dicoba lagi di urutan awal
+COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "60"))
+
+# Urutan penyedia per mode; penyedia berikutnya dipakai bila yang sebelumnya gagal atau lambat
+ROUTES = {
+    "internal": ["telkom", "gemini-flash"],
+    "riset": ["gemini-flash", "gemini-pro"],
+}
+
+
+class ProviderStats:
+    """Statistik latensi token pertama dan tingkat error untuk satu penyedia."""
+
+    def __init__(self, window=STATS_WINDOW, min_samples=MIN_SAMPLES):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency=None):
+        with self._lock:
+            self.outcomes.append(ok)
+            if latency is not None:
+                self.latencies.append(latency)
+            # Hanya sampel buruk yang bisa memicu cooldown; jendela tidak dikosongkan, jadi penyedia
+            # pulih setelah sampel baik menggeser sampel buruk, bukan setelah jendela kosong dinilai ulang
+            bad = not ok or (latency is not None and latency > LATENCY_SLO)
+            if bad and (self.error_rate() > MAX_ERROR_RATE or self.p95() > LATENCY_SLO):
+                self.unhealthy_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def error_rate(self):
+        if len(self.outcomes) < self.min_samples:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def p95(self):
+        if len(self.latencies) < self.min_samples:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+
+def _to_gemini_contents(messages):
+    """Mengubah pesan format OpenAI menjadi `contents` Gemini; pesan sistem digabung ke giliran user pertama."""
+    system_parts = [m["content"] for m in messages if m["role"] == "system"]
+    contents = []
+    for message in messages:
+        if message["role"] == "system":
+            continue
+        role = "user" if message["role"] == "user" else "model"
+        contents.append({"role": role, "parts": [message["content"]]})
+    if system_parts:
+        preamble = "\n\n".join(system_parts)
+        if contents and contents[0]["role"] == "user":
+            contents[0]["parts"] = [preamble + "\n\n" + contents[0]["parts"][0]]
+        else:
+            contents.insert(0, {"role": "user", "parts": [preamble]})
+    return contents
+
+
+class TelkomProvider:
+    def __init__(self, model="telkom-ai"):
+        self.model = model
+
+    def stream(self, messages):
+        client = get_telkom_client()
+        if client is None:
+            raise RuntimeError("TELKOM_API_KEY tidak dikonfigurasi")
+        stream = client.with_options(timeout=LLM_TIMEOUT, max_retries=0).chat.completions.create(
+            model=self.model, messages=messages, stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Koneksi HTTP ditutup juga saat stream ditinggalkan sebelum selesai
+            stream.close()
+
+    async def astream(self, messages):
+        client = get_async_telkom_client()
+        if client is None:
+            raise RuntimeError("TELKOM_API_KEY tidak dikonfigurasi")
+        stream = await client.with_options(timeout=LLM_TIMEOUT, max_retries=0).chat.completions.create(
+            model=self.model, messages=messages, stream=True
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Koneksi HTTP ditutup juga saat stream ditinggalkan sebelum selesai
+            await stream.close()
+
+
+class GeminiProvider:
+    def __init__(self, model_name):
+        self.model = model_name
+
+    def _model(self):
+        model = get_gemini_model(self.model)
+        if model is None:
+            raise RuntimeError("GEMINI_API_KEY tidak dikonfigurasi")
+        return model
+
+    def stream(self, messages):
+        response = self._model().generate_content(
+            _to_gemini_contents(messages), stream=True, request_options={"timeout": LLM_TIMEOUT}
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def astream(self, messages):
+        response = await self._model().generate_content_async(
+            _to_gemini_contents(messages), stream=True, request_options={"timeout": LLM_TIMEOUT}
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+PROVIDERS = {
+    "telkom": TelkomProvider("telkom-ai"),
+    "gemini-flash": GeminiProvider(os.getenv("GEMINI_FLASH_MODEL", "gemini-1.5-flash")),
+    "gemini-pro": GeminiProvider(os.getenv("GEMINI_PRO_MODEL", "gemini-1.5-pro")),
+}
+
+
+class AllProvidersFailed(Exception):
+    pass
+
+
+class ProvidersThrottled(AllProvidersFailed):
+    """Semua penyedia untuk mode ini sedang di atas kuota lokalnya; pesannya layak ditampilkan ke pengguna."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            f"Layanan LLM sedang mencapai batas kuota. Silakan coba lagi dalam {math.ceil(retry_after)} detik."
+        )
+        self.retry_after = retry_after
+
+
+def provider_for_model(model_name):
+    """Nama penyedia di PROVIDERS untuk `model_name`, agar pemanggil Gemini langsung ikut kuota yang sama."""
+    for name, provider in PROVIDERS.items():
+        if provider.model == model_name:
+            return name
+    return None
+
+
+_END_OF_STREAM = object()
+
+
+def _iterate_with_deadline(iterator_factory, first_deadline, idle_timeout=LLM_TIMEOUT):
+    """Menjalankan iterator sinkron di thread terpisah agar token pertama bisa diberi tenggat.
+
+    Melempar TimeoutError bila token pertama tidak datang dalam `first_deadline` detik. Saat
+    tenggat lewat atau pemanggil berhenti membaca, thread pompa berhenti pada potongan berikutnya
+    dan menutup iteratornya (beserta koneksi penyedia), bukan terus mengonsumsi stream yang ditinggalkan.
+    """
+    items = queue.Queue()
+    cancelled = threading.Event()
+
+    def pump():
+        iterator = iterator_factory()
+        try:
+            for item in iterator:
+                if cancelled.is_set():
+                    break
+                items.put(item)
+            items.put(_END_OF_STREAM)
+        except Exception as e:
+            items.put(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=pump, name="llm-stream", daemon=True).start()
+    timeout = first_deadline
+    try:
+        while True:
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"tidak ada respons dalam {timeout:.1f} detik")
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            timeout = idle_timeout
+            yield item
+    finally:
+        cancelled.set()
+
+
+class ProviderRouter:
+    """Memilih penyedia berdasarkan kesehatan terkini dan beralih ke cadangan saat gagal atau lambat.
+
+    Setiap panggilan diberi tenggat sampai token pertama. Failover hanya dilakukan sebelum
+    token pertama diterima; setelah jawaban mulai mengalir, error diteruskan ke pemanggil
+    agar teks tidak tercampur antar penyedia.
+    """
+
+    def __init__(self, providers=None, routes=None, deadline=CALL_DEADLINE, limiter=None):
+        self.providers = providers or PROVIDERS
+        self.routes = routes or ROUTES
+        self.deadline = deadline
+        self.limiter = limiter or get_provider_limiter()
+        self.stats = {name: ProviderStats() for name in self.providers}
+
+    def plan(self, mode):
+        """Urutan penyedia untuk `mode`: yang sehat lebih dulu, yang sedang cooldown di akhir."""
+        route = self.routes[mode]
+        healthy = [name for name in route if self.stats[name].healthy()]
+        degraded = [name for name in route if name not in healthy]
+        if degraded:
+            logger.info(f"Routing {mode}: {degraded} melewati SLO/error, urutan dipakai {healthy + degraded}")
+        return healthy + degraded
+
+    def _answered(self, name, mode, started, route_info):
+        latency = time.monotonic() - started
+        self.stats[name].record(ok=True, latency=latency)
+        if route_info is not None:
+            route_info["provider"] = name
+            route_info["model"] = self.providers[name].model
+            route_info["ttft_seconds"] = latency
+        logger.info(f"Routing {mode}: dijawab oleh {name} (TTFT {latency:.2f}s)")
+
+    def _throttled(self, name, mode, wait, waits):
+        """True jika kuota lokal `name` habis; penyedia dilewati tanpa dianggap gagal."""
+        if not wait:
+            return False
+        waits.append(wait)
+        logger.info(f"Routing {mode}: kuota lokal {name} habis ({wait:.1f}s lagi), mencoba cadangan")
+        return True
+
+    def _exhausted(self, errors, waits):
+        if waits and not errors:
+            return ProvidersThrottled(min(waits))
+        if waits:
+            errors.append(f"{len(waits)} penyedia di atas kuota lokal")
+        return AllProvidersFailed("; ".join(errors))
+
+    def _failed(self, name, mode, error, errors):
+        self.stats[name].record(ok=False)
+        errors.append(f"{name}: {error}")
+        logger.warning(f"Routing {mode}: penyedia {name} gagal sebelum token pertama ({error}), mencoba cadangan")
+
+    def stream(self, mode, messages, route_info=None):
+        """Menghasilkan potongan teks dari penyedia pertama yang berhasil untuk `mode`.
+
+        Jika `route_info` (dict) diberikan, nama penyedia, model yang menjawab, dan TTFT disimpan di sana.
+        """
+        errors, waits = [], []
+        for name in self.plan(mode):
+            if self._throttled(name, mode, self.limiter.try_acquire(name), waits):
+                continue
+            provider = self.providers[name]
+            started = time.monotonic()
+            first_token = True
+            try:
+                for text in _iterate_with_deadline(lambda: provider.stream(messages), self.deadline):
+                    if first_token:
+                        first_token = False
+                        self._answered(name, mode, started, route_info)
+                    yield text
+            except Exception as e:
+                if not first_token:
+                    raise
+                self._failed(name, mode, e, errors)
+                continue
+            if first_token:
+                self._answered(name, mode, started, route_info)
+            return
+        raise self._exhausted(errors, waits)
+
+    async def astream(self, mode, messages, route_info=None):
+        """Versi async dari `stream` untuk telegram_bot."""
+        errors, waits = [], []
+        for name in self.plan(mode):
+            if self._throttled(name, mode, self.limiter.try_acquire(name), waits):
+                continue
+            started = time.monotonic()
+            chunks = self.providers[name].astream(messages)
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), self.deadline)
+            except StopAsyncIteration:
+                self._answered(name, mode, started, route_info)
+                return
+            except Exception as e:
+                self._failed(name, mode, e if str(e) else type(e).__name__, errors)
+                await chunks.aclose()
+                continue
+            self._answered(name, mode, started, route_info)
+            yield first
+            async for text in chunks:
+                yield text
+            return
+        raise self._exhausted(errors, waits)
+
+
+_ROUTER = ProviderRouter()
+
+
+def get_router():
+    return _ROUTER
@@ -1,13 +1,20 @@
 # Impor pustaka (library) yang diperlukan
-from openai import OpenAI
-import google.generativeai as genai
 import streamlit as st
-import os
+import time
+import uuid
 from dotenv import load_dotenv
-import pandas as pd
-import tabulate
 from io import BytesIO
 
+from admission import AdmissionRejected, get_admission_controller
+
+from chat_history import ChatHistoryManager, gemini_summarizer
+from data_sources import get_data_sources
+from context_packer import question_with_context
+from metrics import start_trace
+from provider_router import ProvidersThrottled, get_router
+from sph_jobs import get_sph_queue, read_batch_file
+from response_cache import get_response_cache
+
 # Muat variabel lingkungan dari file .env (untuk menyimpan kunci API)
 load_dotenv()
 
@@ -23,7 +30,7 @@ Aturan Anda:
 - Jika data tidak ditemukan dalam database, Anda harus menyatakan: "Maaf, data yang Anda cari tidak ditemukan dalam database."
 - Jangan mengarang informasi atau menjawab pertanyaan di luar lingkup data yang disediakan.
 
-Berikut adalah data pelanggan yang relevan untuk permintaan pengguna:
+Data pelanggan yang relevan untuk setiap permintaan disertakan bersama pertanyaan pengguna.
 """
 
 ASKARINA_RESEARCH_PROMPT = """Anda adalah ASKARINA, seorang Asisten Riset B2B industri telekomunikasi. Peran Anda adalah untuk menjawab pertanyaan pengetahuan umum dan melakukan pencarian di internet untuk menemukan informasi, seperti analisis pasar, profil perusahaan, atau tren industri untuk mencari prospek pelanggan baru di sektor pelayanan digital dan Telekomunikasi.
@@ -34,60 +41,6 @@ ASKARINA_RESEARCH_PROMPT = """Anda adalah ASKARINA, seorang Asisten Riset B2B in
 # --- Konfigurasi API dan Database ---
 SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vR7b41aChFNSZ9CXvQV5ILKH7J3cUTJDqcvT48tl-EAT---7g0m9K17fgvXAn7diXdm0jMPmAScT1Jl/pub?output=xlsx"
 
-# --- Inisialisasi Klien API ---
-@st.cache_resource
-def get_telkom_client():
-    api_key = os.getenv("TELKOM_API_KEY")
-    if not api_key: return None
-    try:
-        return OpenAI(api_key=api_key, base_url="https://telkom-ai-dag-api.apilogy.id/Telkom-LLM/0.0.4/llm", default_headers={"x-api-key": api_key})
-    except Exception: return None
-
-@st.cache_resource
-def get_gemini_client():
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key: return None
-    try:
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel('gemini-1.5-flash')
-    except Exception: return None
-
-# --- Fungsi Pemuatan dan Pencarian Database ---
-@st.cache_data
-def load_database_as_df(url):
-    try:
-        return pd.read_excel(url, engine="openpyxl")
-    except Exception: return None
-
-def find_relevant_context(prompt, df):
-    if df is None or df.empty: return "Database tidak dimuat atau kosong."
-    prompt_keywords = set(prompt.lower().split())
-    df_searchable = df.astype(str).apply(lambda x: ' '.join(x).lower(), axis=1)
-    mask = df_searchable.str.contains('|'.join(prompt_keywords), na=False)
-    relevant_df = df[mask]
-    if relevant_df.empty: return "Tidak ada data spesifik yang ditemukan untuk permintaan Anda di database."
-    return tabulate.tabulate(relevant_df, headers="keys", tablefmt="github", showindex=False)
-
-# --- Fungsi Pembuatan SPH ---
-def generate_sph_content(data):
-    prompt = f"""
-    Berdasarkan informasi berikut, buat draf dokumen SPH (Surat Penawaran Harga) yang profesional dalam Bahasa Indonesia.
-    
-    - Nama Pelanggan: {data['customer_name']}
-    - Alamat Pelanggan: {data['customer_address']}
-    - Produk/Layanan: {data['product']}
-    - Harga: {data['price']}
-    - Catatan Tambahan: {data['notes']}
-
-    Dokumen harus memiliki header yang jelas, pendahuluan, detail penawaran, harga, syarat dan ketentuan, serta penutup.
-    """
-    try:
-        gemini_client = get_gemini_client()
-        response = gemini_client.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Terjadi kesalahan saat membuat SPH: {e}"
-
 # --- Tata Letak Aplikasi Utama ---
 col1, col2 = st.columns([2, 1])
 
@@ -105,6 +58,10 @@ with col1:
     # Inisialisasi riwayat chat
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "admission_id" not in st.session_state:
+        st.session_state.admission_id = f"streamlit-{uuid.uuid4().hex}"
+    if "history_manager" not in st.session_state:
+        st.session_state.history_manager = ChatHistoryManager(summarize=gemini_summarizer())
 
     # Tampilkan riwayat chat
     for message in st.session_state.messages:
@@ -120,41 +77,85 @@ with col1:
         with st.chat_message("assistant"):
             response_container = st.empty()
             full_response = ""
+            response_cache = get_response_cache()
+            history_manager = st.session_state.history_manager
+            previous_messages = st.session_state.messages[:-1]
+            # Jawaban di tengah percakapan bergantung pada riwayat dan ringkasannya, jadi hanya
+            # giliran pertama (tanpa riwayat) yang dibaca dari dan disimpan ke cache jawaban
+            use_cache = not previous_messages
+            # Durasi setiap tahap giliran ini dicatat ke log dan sink metrik
+            trace = start_trace("chat", frontend="streamlit")
+            status = "ok"
 
             # --- Logika untuk mengarahkan prompt ke AI yang benar ---
+            # Router memilih penyedia yang sehat dan beralih ke cadangan bila lambat atau gagal
+            router = get_router()
+            api_messages = None
             if selected_mode == "Data Internal (Telkom LLM)":
-                telkom_client = get_telkom_client()
-                db_df = st.session_state.get("database_df")
-                if not telkom_client or db_df is None:
+                route = "internal"
+                with trace.stage("data_load"):
+                    view = get_data_sources(SPREADSHEET_URL).select(prompt)
+                trace.set(sources=[spec.name for spec, _ in view.snapshots])
+                with trace.stage("structured_query"):
+                    direct = view.answer_structured(prompt) if view.available else None
+                if not view.available:
                     full_response = "Error: ASKARINA mode internal tidak terkonfigurasi dengan benar. Periksa kunci API dan tautan spreadsheet."
+                    status = "unavailable"
+                elif direct:
+                    # Lookup/agregat sederhana dijawab langsung dari database tanpa memanggil LLM
+                    full_response = direct
+                    status = "structured"
+                elif use_cache and (cached := response_cache.get(prompt, route, "telkom-ai", view.version)):
+                    full_response = cached
+                    status = "cache_hit"
                 else:
-                    relevant_knowledge = find_relevant_context(prompt, db_df)
-                    final_system_prompt = ASKARINA_INTERNAL_PROMPT + "\n" + relevant_knowledge
-                    api_messages = [{"role": "system", "content": final_system_prompt}, {"role": "user", "content": prompt}]
-                    try:
-                        stream = telkom_client.chat.completions.create(model="telkom-ai", messages=api_messages, stream=True)
-                        for chunk in stream:
-                            if chunk.choices[0].delta.content:
-                                full_response += chunk.choices[0].delta.content
-                                response_container.markdown(full_response + "▌")
-                    except Exception as e:
-                        full_response = f"Error saat memanggil Telkom API: {e}"
+                    with trace.stage("context_search"):
+                        relevant_knowledge = view.relevant_context(prompt, model="telkom-ai")
+                    # Prompt sistem statis selalu di depan dan tidak berubah agar bisa di-cache penyedia
+                    api_messages = history_manager.as_openai_messages(ASKARINA_INTERNAL_PROMPT, previous_messages)
+                    api_messages.append({"role": "user", "content": question_with_context(prompt, relevant_knowledge)})
+                    cache_args = ("telkom-ai", view.version)
 
             elif selected_mode == "Riset Prospek & Umum (Google Gemini)":
-                gemini_client = get_gemini_client()
-                if not gemini_client:
-                    full_response = "Error: ASKARINA mode riset tidak terkonfigurasi. Periksa kunci API Gemini Anda."
+                route = "riset"
+                if use_cache and (cached := response_cache.get(prompt, route, "gemini")):
+                    full_response = cached
+                    status = "cache_hit"
                 else:
-                    final_prompt = ASKARINA_RESEARCH_PROMPT + "\n\nPertanyaan Pengguna: " + prompt
-                    try:
-                        stream = gemini_client.generate_content(final_prompt, stream=True)
-                        for chunk in stream:
-                            full_response += chunk.text
-                            response_container.markdown(full_response + "▌")
-                    except Exception as e:
-                        full_response = f"Error saat memanggil Gemini API: {e}"
+                    api_messages = history_manager.as_openai_messages(ASKARINA_RESEARCH_PROMPT, previous_messages)
+                    api_messages.append({"role": "user", "content": "Pertanyaan Pengguna: " + prompt})
+                    cache_args = ("gemini", None)
+
+            trace.set(mode=route)
+            if api_messages is not None:
+                trace.prompt(api_messages)
+                route_info = {}
+
+                def show_queue_position(position):
+                    trace.set(queue_position=position)
+                    response_container.markdown(f"⏳ Permintaan Anda dalam antrean, posisi {position}.")
+
+                try:
+                    # Slot panggilan LLM dibagi semua sesi Streamlit di proses ini; satu sesi dianggap satu pengguna
+                    queued_at = time.monotonic()
+                    with get_admission_controller().acquire(st.session_state.admission_id, on_queued=show_queue_position):
+                        trace.add_stage("slot_wait", time.monotonic() - queued_at)
+                        with trace.stage("generation"):
+                            for text in router.stream(route, api_messages, route_info):
+                                full_response += text
+                                response_container.markdown(full_response + "▌")
+                    if use_cache:
+                        response_cache.set(prompt, route, cache_args[0], full_response, cache_args[1])
+                except (AdmissionRejected, ProvidersThrottled) as e:
+                    full_response = str(e)
+                    status = "shed"
+                except Exception as e:
+                    full_response = f"Error saat memanggil layanan LLM: {e}"
+                    status = "error"
+                trace.routed(route_info)
             
             response_container.markdown(full_response)
+            trace.finish(status, full_response)
             st.session_state.messages.append({"role": "assistant", "content": full_response})
 
 with col2:
@@ -169,31 +170,90 @@ with col2:
         notes = st.text_area("Catatan Tambahan (opsional)")
         submitted = st.form_submit_button("Buat Draf SPH")
 
+    sph_queue = get_sph_queue()
+
     if submitted:
         if not all([customer_name, customer_address, product, price]):
             st.warning("Mohon lengkapi semua kolom yang wajib diisi.")
         else:
-            with st.spinner("ASKARINA sedang membuat draf SPH..."):
-                sph_data = {
-                    "customer_name": customer_name,
-                    "customer_address": customer_address,
-                    "product": product,
-                    "price": price,
-                    "notes": notes,
-                }
-                generated_content = generate_sph_content(sph_data)
-                st.session_state.sph_content = generated_content
-
-    if "sph_content" in st.session_state:
-        st.text_area("Draf SPH", st.session_state.sph_content, height=300)
-        sph_bytes = st.session_state.sph_content.encode('utf-8')
+            sph_data = {
+                "customer_name": customer_name,
+                "customer_address": customer_address,
+                "product": product,
+                "price": price,
+                "notes": notes,
+            }
+            # SPH dibuat oleh worker di latar belakang; form langsung bisa dipakai lagi
+            st.session_state.sph_job_id = sph_queue.submit(sph_data).id
+
+    sph_job = sph_queue.get(st.session_state.get("sph_job_id"))
+
+    # Status pekerjaan diperbarui otomatis setiap 2 detik selama SPH masih diproses
+    @st.fragment(run_every=2 if sph_job and not sph_job.finished else None)
+    def show_sph_job():
+        job = sph_queue.get(st.session_state.get("sph_job_id"))
+        if job is None:
+            return
+        if not job.finished:
+            st.info("⏳ ASKARINA sedang membuat draf SPH...")
+            return
+        if sph_job is not None and not sph_job.finished:
+            st.rerun()  # Muat ulang sekali agar pembaruan otomatis berhenti
+        if job.status == "failed":
+            st.error(f"Terjadi kesalahan saat membuat SPH: {job.error}")
+            return
+        st.text_area("Draf SPH", job.text, height=300)
+        for file_name, content in job.files.items():
+            is_docx = file_name.endswith(".docx")
+            st.download_button(
+                label=f"Download SPH ({'.docx' if is_docx else '.txt'})",
+                data=BytesIO(content),
+                file_name=file_name,
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document" if is_docx else "text/plain",
+                key=f"download_{file_name}",
+            )
+
+    show_sph_job()
+
+    # --- Pembuatan SPH Massal dari File CSV/XLSX ---
+    st.subheader("SPH Massal")
+    batch_file = st.file_uploader(
+        "Unggah daftar pelanggan (kolom: pelanggan, alamat, produk, harga, catatan)", type=["csv", "xlsx"]
+    )
+    if batch_file and st.button("Buat SPH Massal"):
+        try:
+            rows = read_batch_file(batch_file.getvalue(), batch_file.name)
+        except Exception as e:
+            st.error(f"File batch tidak dapat dibaca: {e}")
+        else:
+            st.session_state.sph_batch_id = sph_queue.submit_batch(rows)
+
+    batch_id = st.session_state.get("sph_batch_id")
+    batch_done, batch_total = sph_queue.batch_progress(batch_id) if batch_id else (0, 0)
+
+    @st.fragment(run_every=2 if batch_total and batch_done < batch_total else None)
+    def show_sph_batch():
+        done, total = sph_queue.batch_progress(batch_id)
+        if not total:
+            return
+        st.progress(done / total, text=f"{done}/{total} SPH selesai")
+        if done < total:
+            return
+        if batch_done < batch_total:
+            st.rerun()  # Muat ulang sekali agar pembaruan otomatis berhenti
+        failed = [job for job in sph_queue.batch_jobs(batch_id) if job.status == "failed"]
+        if failed:
+            st.warning(f"{len(failed)} SPH gagal dibuat: " + ", ".join(job.data["customer_name"] for job in failed))
         st.download_button(
-            label="Download SPH (.txt)",
-            data=BytesIO(sph_bytes),
-            file_name=f"SPH_{customer_name.replace(' ', '_')}.txt",
-            mime="text/plain"
+            label="Download Semua SPH (.zip)",
+            data=sph_queue.batch_zip(batch_id),
+            file_name="SPH_batch.zip",
+            mime="application/zip",
         )
 
+    if batch_id:
+        show_sph_batch()
+
 # --- Pengaturan Awal Saat Aplikasi Dimuat ---
-if "database_df" not in st.session_state:
-    st.session_state.database_df = load_database_as_df(SPREADSHEET_URL)
+# Registry sumber data dipakai bersama oleh semua sesi dalam proses ini; tiap sumber dimuat saat pertama dibutuhkan
+get_data_sources(SPREADSHEET_URL)
@@ -0,0 +1,121 @@
+# Cache jawaban LLM yang dipakai bersama oleh proyek.py dan telegram_bot.py
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# Model embedding lokal (sentence-transformers) untuk pencocokan pertanyaan yang mirip; kosong = nonaktif
+EMBEDDING_MODEL = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "")
+SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_prompt(prompt):
+    """Menyamakan huruf, spasi, dan tanda baca agar pertanyaan yang sama menghasilkan kunci yang sama."""
+    return _NON_WORD.sub(" ", prompt.lower()).strip()
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def load_local_embedder(model_name=EMBEDDING_MODEL):
+    """Mengembalikan fungsi teks -> vektor dari sentence-transformers, atau None jika tidak tersedia."""
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text).tolist()
+
+
+class ResponseCache:
+    """Cache LRU dengan TTL untuk jawaban per (mode, model, versi database, pertanyaan)."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, embedder=None,
+                 similarity_threshold=SIMILARITY_THRESHOLD):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, mode, model, db_version=None):
+        return (mode, model, db_version, normalize_prompt(prompt))
+
+    def _expired(self, entry, now):
+        return now - entry["created_at"] > self.ttl
+
+    def get(self, prompt, mode, model, db_version=None):
+        key = self.make_key(prompt, mode, model, db_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    self._entries.move_to_end(key)
+                    return entry["response"]
+                del self._entries[key]
+        if self.embedder is None:
+            return None
+        return self._get_similar(key, now)
+
+    def _get_similar(self, key, now):
+        """Mencari jawaban untuk pertanyaan yang hampir sama dengan konteks (mode, model, versi) yang sama."""
+        vector = self.embedder(key[3])
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for other_key, entry in self._entries.items():
+                if other_key[:3] != key[:3] or entry["vector"] is None or self._expired(entry, now):
+                    continue
+                score = _cosine(vector, entry["vector"])
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key]["response"]
+
+    def set(self, prompt, mode, model, response, db_version=None):
+        key = self.make_key(prompt, mode, model, db_version)
+        vector = self.embedder(key[3]) if self.embedder is not None else None
+        with self._lock:
+            self._entries[key] = {"response": response, "vector": vector, "created_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_db_versions(self, current_version):
+        """Menghapus jawaban yang dibuat dari versi database selain `current_version`."""
+        with self._lock:
+            stale = [key for key in self._entries if key[2] is not None and key[2] != current_version]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache():
+    """Mengembalikan cache jawaban bersama untuk proses ini."""
+    global _RESPONSE_CACHE
+    with _RESPONSE_CACHE_LOCK:
+        if _RESPONSE_CACHE is None:
+            _RESPONSE_CACHE = ResponseCache(embedder=load_local_embedder())
+    return _RESPONSE_CACHE
@@ -0,0 +1,198 @@
+# Antrean pekerjaan pembuatan SPH (Surat Penawaran Harga) untuk proyek.py dan telegram_bot.py
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+from metrics import start_trace
+from sph_template import generate_offer_paragraph, letter_number, load_template, render_sph_docx, render_sph_text
+
+logger = logging.getLogger(__name__)
+
+SPH_MAX_WORKERS = int(os.getenv("SPH_MAX_WORKERS", "4"))
+SPH_MAX_BATCH_ROWS = int(os.getenv("SPH_MAX_BATCH_ROWS", "200"))
+# Pekerjaan yang sudah selesai disimpan sebatas ini agar memori tidak terus bertambah
+SPH_MAX_FINISHED_JOBS = 500
+SPH_MAX_BATCHES = 50
+
+SPH_FIELDS = ["customer_name", "customer_address", "product", "price", "notes"]
+# Nama kolom yang diterima pada file batch CSV/XLSX (huruf kecil) untuk setiap field SPH
+BATCH_COLUMN_ALIASES = {
+    "customer_name": ["customer_name", "customer", "nama pelanggan", "pelanggan", "nama"],
+    "customer_address": ["customer_address", "address", "alamat pelanggan", "alamat"],
+    "product": ["product", "produk", "produk/layanan", "layanan"],
+    "price": ["price", "harga", "harga penawaran"],
+    "notes": ["notes", "catatan", "catatan tambahan"],
+}
+
+
+def sph_file_name(data, extension):
+    customer_name = re.sub(r"[^\w.-]+", "_", str(data.get("customer_name") or "customer").strip())
+    return f"SPH_{customer_name}.{extension}"
+
+
+class SphJob:
+    """Satu permintaan SPH beserta status dan file hasilnya."""
+
+    def __init__(self, data, batch_id=None):
+        self.id = uuid.uuid4().hex
+        self.batch_id = batch_id
+        self.data = data
+        self.status = "queued"  # queued -> running -> done / failed
+        self.text = None
+        self.files = {}  # nama_file -> bytes
+        self.error = None
+        self.future = None
+        self.submitted_at = time.monotonic()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+class SphJobQueue:
+    """Menjalankan pekerjaan SPH di worker pool dengan konkurensi terbatas."""
+
+    def __init__(self, max_workers=SPH_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sph-worker")
+        self._jobs = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self.template = load_template()
+
+    def _run(self, job):
+        job.status = "running"
+        trace = start_trace("sph", "batch" if job.batch_id else "single")
+        trace.add_stage("queue_wait", time.monotonic() - job.submitted_at)
+        try:
+            # Hanya paragraf penawaran yang ditulis LLM; bagian lain dirender dari template
+            with trace.stage("offer_paragraph"):
+                offer_paragraph = generate_offer_paragraph(job.data, self.template, batch=job.batch_id is not None)
+            # Versi teks dan Word memakai nomor surat yang sama, diturunkan dari id pekerjaan
+            number = letter_number(job.id)
+            with trace.stage("render_text"):
+                job.text = render_sph_text(job.data, offer_paragraph, self.template, number=number)
+            with trace.stage("render_docx"):
+                job.files[sph_file_name(job.data, "docx")] = render_sph_docx(
+                    job.data, offer_paragraph, self.template, number=number
+                )
+            job.files[sph_file_name(job.data, "txt")] = job.text.encode("utf-8")
+            job.status = "done"
+            trace.finish("ok", offer_paragraph)
+        except Exception as e:
+            logger.error(f"Error saat membuat SPH untuk {job.data.get('customer_name')}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+            trace.finish("error")
+        return job
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished and job.batch_id is None]
+        for job_id in finished[:max(0, len(self._jobs) - SPH_MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def submit(self, data, batch_id=None):
+        """Memasukkan satu permintaan SPH ke antrean dan mengembalikan objek SphJob."""
+        job = SphJob({field: data.get(field, "") for field in SPH_FIELDS}, batch_id)
+        with self._lock:
+            self._evict_finished()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def submit_batch(self, rows):
+        """Memasukkan banyak permintaan sekaligus; mengembalikan id batch."""
+        check_batch_size(len(rows))
+        batch_id = uuid.uuid4().hex
+        jobs = [self.submit(row, batch_id) for row in rows]
+        with self._lock:
+            self._batches[batch_id] = jobs
+            oldest = list(self._batches)[:max(0, len(self._batches) - SPH_MAX_BATCHES)]
+        for old_batch_id in oldest:
+            self.discard_batch(old_batch_id)
+        return batch_id
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def batch_jobs(self, batch_id):
+        return self._batches.get(batch_id, [])
+
+    def batch_progress(self, batch_id):
+        jobs = self.batch_jobs(batch_id)
+        return sum(job.finished for job in jobs), len(jobs)
+
+    def batch_zip(self, batch_id):
+        """Menggabungkan semua file .docx dari batch yang sudah selesai ke dalam satu arsip zip."""
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            used_names = set()
+            for index, job in enumerate(self.batch_jobs(batch_id), start=1):
+                for file_name, content in job.files.items():
+                    if not file_name.endswith(".docx"):
+                        continue
+                    if file_name in used_names:
+                        file_name = f"{index}_{file_name}"
+                    used_names.add(file_name)
+                    archive.writestr(file_name, content)
+        return buffer.getvalue()
+
+    def discard_batch(self, batch_id):
+        with self._lock:
+            for job in self._batches.pop(batch_id, []):
+                self._jobs.pop(job.id, None)
+
+
+def check_batch_size(count):
+    """Menolak batch di atas SPH_MAX_BATCH_ROWS baris alih-alih memotongnya diam-diam."""
+    if count > SPH_MAX_BATCH_ROWS:
+        raise ValueError(
+            f"file berisi {count} baris SPH, melebihi batas {SPH_MAX_BATCH_ROWS} baris per batch. "
+            "Pecah file menjadi beberapa bagian lalu unggah satu per satu."
+        )
+
+
+def read_batch_file(file_bytes, file_name):
+    """Membaca baris SPH dari file CSV/XLSX berisi kolom pelanggan, alamat, produk, harga, catatan."""
+    if file_name.lower().endswith(".csv"):
+        df = pd.read_csv(BytesIO(file_bytes), dtype=str)
+    else:
+        df = pd.read_excel(BytesIO(file_bytes), engine="openpyxl", dtype=str)
+    columns = {str(column).strip().lower(): column for column in df.columns}
+    mapping = {}
+    for field, aliases in BATCH_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in columns:
+                mapping[field] = columns[alias]
+                break
+    missing = [field for field in SPH_FIELDS[:4] if field not in mapping]
+    if missing:
+        raise ValueError(f"Kolom wajib tidak ditemukan: {', '.join(missing)}")
+    rows = []
+    for record in df.fillna("").to_dict("records"):
+        row = {field: str(record[column]).strip() for field, column in mapping.items()}
+        row.setdefault("notes", "")
+        if all(row[field] for field in SPH_FIELDS[:4]):
+            rows.append(row)
+    check_batch_size(len(rows))
+    return rows
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_sph_queue():
+    """Mengembalikan antrean SPH bersama untuk proses ini."""
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = SphJobQueue()
+    return _QUEUE
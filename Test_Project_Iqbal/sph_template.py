@@ -0,0 +1,224 @@
+# Template SPH (Surat Penawaran Harga): bagian baku dirender lokal, hanya paragraf penawaran yang ditulis LLM
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date
+from io import BytesIO
+
+import docx
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, get_admission_controller, get_provider_limiter
+from llm_clients import DEFAULT_GEMINI_MODEL, gemini_request_options, get_gemini_model
+from provider_router import provider_for_model
+
+logger = logging.getLogger(__name__)
+
+# File JSON opsional untuk mengganti sebagian teks baku di SPH_TEMPLATE
+SPH_TEMPLATE_PATH = os.getenv("SPH_TEMPLATE_PATH", "")
+OFFER_CACHE_MAX_ENTRIES = int(os.getenv("SPH_OFFER_CACHE_MAX_ENTRIES", "512"))
+# Lama maksimum menunggu kuota Gemini sebelum memakai paragraf baku (detik)
+OFFER_QUOTA_WAIT = float(os.getenv("SPH_OFFER_QUOTA_WAIT", "30"))
+
+SPH_TEMPLATE = {
+    "company": "PT Telkom Indonesia (Persero) Tbk",
+    "city": "Jakarta",
+    "title": "SURAT PENAWARAN HARGA",
+    "subject": "Penawaran Harga {product}",
+    "salutation": "Dengan hormat,",
+    "introduction": (
+        "Bersama surat ini, kami {company} bermaksud menyampaikan penawaran harga untuk "
+        "{product} kepada {customer_name}. Penawaran ini kami susun sesuai kebutuhan yang "
+        "telah disampaikan sebelumnya."
+    ),
+    "terms": [
+        "Harga yang tercantum belum termasuk Pajak Pertambahan Nilai (PPN) sesuai ketentuan yang berlaku.",
+        "Penawaran ini berlaku selama 30 (tiga puluh) hari kalender sejak tanggal surat.",
+        "Pembayaran dilakukan sesuai termin yang disepakati dalam kontrak berlangganan.",
+        "Jadwal implementasi akan dikonfirmasi setelah penawaran disetujui oleh pelanggan.",
+    ],
+    "closing": (
+        "Demikian surat penawaran ini kami sampaikan. Besar harapan kami penawaran ini dapat "
+        "diterima. Atas perhatian dan kerja sama Bapak/Ibu, kami ucapkan terima kasih."
+    ),
+    "signature": "Hormat kami,\n\n\n{company}",
+    "fallback_offer": (
+        "Kami menawarkan {product} sebagai solusi untuk mendukung kebutuhan operasional "
+        "{customer_name}. {notes}"
+    ),
+}
+
+OFFER_PROMPT = """Tulis satu paragraf penawaran (3-5 kalimat) dalam Bahasa Indonesia yang profesional untuk Surat Penawaran Harga.
+Jelaskan manfaat produk bagi pelanggan secara spesifik. Jangan tulis salam, harga, syarat, atau penutup.
+- Nama Pelanggan: {customer_name}
+- Produk/Layanan: {product}
+- Catatan Tambahan: {notes}
+"""
+
+MONTHS = [
+    "Januari", "Februari", "Maret", "April", "Mei", "Juni",
+    "Juli", "Agustus", "September", "Oktober", "November", "Desember",
+]
+
+
+def load_template(path=SPH_TEMPLATE_PATH):
+    template = dict(SPH_TEMPLATE)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            template.update(json.load(f))
+    return template
+
+
+def format_date(day=None):
+    day = day or date.today()
+    return f"{day.day} {MONTHS[day.month - 1]} {day.year}"
+
+
+def letter_number(reference=None, day=None):
+    """Nomor surat dari id pekerjaan SPH; pelanggan dan produk yang sama di bulan yang sama tetap beda nomor."""
+    day = day or date.today()
+    reference = (reference or uuid.uuid4().hex)[:8].upper()
+    return f"SPH/{reference}/{day.month:02d}/{day.year}"
+
+
+def notes_text(data):
+    """Catatan tambahan, atau "" jika kosong atau "-" (jawaban "tidak ada" di bot Telegram)."""
+    notes = str(data.get("notes") or "").strip()
+    return "" if notes == "-" else notes
+
+
+class OfferParagraphCache:
+    """Cache LRU untuk paragraf penawaran buatan LLM, dengan kunci pelanggan + produk + catatan."""
+
+    def __init__(self, max_entries=OFFER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data):
+        return tuple(" ".join(str(data.get(field, "")).lower().split()) for field in ("customer_name", "product", "notes"))
+
+    def get(self, data):
+        key = self.key(data)
+        with self._lock:
+            paragraph = self._entries.get(key)
+            if paragraph is not None:
+                self._entries.move_to_end(key)
+            return paragraph
+
+    def set(self, data, paragraph):
+        with self._lock:
+            self._entries[self.key(data)] = paragraph
+            self._entries.move_to_end(self.key(data))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_OFFER_CACHE = OfferParagraphCache()
+
+
+def generate_offer_paragraph(data, template=SPH_TEMPLATE, cache=_OFFER_CACHE, batch=False):
+    """Paragraf penawaran yang dipersonalisasi; memakai cache dan jatuh ke teks baku jika LLM gagal.
+
+    Panggilan LLM ikut antrean admission controller (batch di belakang chat interaktif) dan
+    kuota lokal Gemini; bila kuota tidak tersedia dalam OFFER_QUOTA_WAIT, teks baku yang dipakai.
+    """
+    paragraph = cache.get(data)
+    if paragraph is not None:
+        return paragraph
+    try:
+        model = get_gemini_model()
+        if model is None:
+            raise RuntimeError("GEMINI_API_KEY tidak dikonfigurasi")
+        # Kuota ditunggu sebelum mengambil slot, agar slot tidak tertahan selama menunggu kuota
+        provider = provider_for_model(DEFAULT_GEMINI_MODEL)
+        if provider and not get_provider_limiter().acquire(provider, OFFER_QUOTA_WAIT):
+            raise RuntimeError("kuota lokal Gemini habis")
+        priority = PRIORITY_BATCH if batch else PRIORITY_INTERACTIVE
+        with get_admission_controller().acquire(None, priority, timeout=None):
+            response = model.generate_content(OFFER_PROMPT.format(**data), request_options=gemini_request_options())
+        paragraph = " ".join(response.text.split())
+    except Exception as e:
+        logger.warning(f"Paragraf penawaran LLM tidak tersedia untuk {data['customer_name']}, memakai teks baku: {e}")
+        return template["fallback_offer"].format(**{**data, "notes": notes_text(data)}).strip()
+    cache.set(data, paragraph)
+    return paragraph
+
+
+def _fields(data, template):
+    return {**data, "company": template["company"]}
+
+
+def render_sph_text(data, offer_paragraph, template=SPH_TEMPLATE, day=None, number=None):
+    """Versi teks polos SPH (untuk pratinjau dan unduhan .txt)."""
+    fields = _fields(data, template)
+    lines = [
+        f"{template['city']}, {format_date(day)}",
+        f"Nomor: {number or letter_number(day=day)}",
+        f"Perihal: {template['subject'].format(**fields)}",
+        "",
+        "Kepada Yth.",
+        data["customer_name"],
+        data["customer_address"],
+        "",
+        template["title"],
+        "",
+        template["salutation"],
+        template["introduction"].format(**fields),
+        "",
+        offer_paragraph,
+        "",
+        "Rincian Penawaran:",
+        f"- Produk/Layanan: {data['product']}",
+        f"- Harga: {data['price']}",
+    ]
+    if notes_text(data):
+        lines.append(f"- Catatan: {notes_text(data)}")
+    lines += ["", "Syarat dan Ketentuan:"]
+    lines += [f"{number}. {term}" for number, term in enumerate(template["terms"], start=1)]
+    lines += ["", template["closing"], "", template["signature"].format(**fields)]
+    return "\n".join(lines)
+
+
+def render_sph_docx(data, offer_paragraph, template=SPH_TEMPLATE, day=None, number=None):
+    """Dokumen Word SPH yang terstruktur (judul, tabel rincian, daftar syarat) dalam bytes."""
+    fields = _fields(data, template)
+    document = docx.Document()
+
+    header = document.add_paragraph(f"{template['city']}, {format_date(day)}")
+    header.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    document.add_paragraph(f"Nomor: {number or letter_number(day=day)}\nPerihal: {template['subject'].format(**fields)}")
+    document.add_paragraph(f"Kepada Yth.\n{data['customer_name']}\n{data['customer_address']}")
+
+    title = document.add_heading(template["title"], level=1)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    document.add_paragraph(template["salutation"])
+    document.add_paragraph(template["introduction"].format(**fields))
+    document.add_paragraph(offer_paragraph)
+
+    document.add_heading("Rincian Penawaran", level=2)
+    rows = [("Produk/Layanan", data["product"]), ("Harga", data["price"])]
+    if notes_text(data):
+        rows.append(("Catatan", notes_text(data)))
+    table = document.add_table(rows=0, cols=2)
+    table.style = "Table Grid"
+    for label, value in rows:
+        cells = table.add_row().cells
+        cells[0].text = label
+        cells[1].text = str(value)
+
+    document.add_heading("Syarat dan Ketentuan", level=2)
+    for term in template["terms"]:
+        document.add_paragraph(term, style="List Number")
+
+    document.add_paragraph(template["closing"])
+    document.add_paragraph(template["signature"].format(**fields))
+
+    doc_io = BytesIO()
+    document.save(doc_io)
+    return doc_io.getvalue()
@@ -0,0 +1,333 @@
+# Jalur cepat untuk pertanyaan lookup/agregat yang bisa dijawab langsung dari DataFrame tanpa LLM
+import logging
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+from context_packer import is_empty
+from database_search import LEGAL_SUFFIXES, STOPWORDS, tokenize
+from name_index import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Kata kunci pada judul kolom untuk mengenali kolom nama pelanggan, NIPNAS, dan segmen (urutan = prioritas)
+ROLE_KEYWORDS = {
+    "nipnas": ["nipnas"],
+    "name": ["nama pelanggan", "nama customer", "customer name", "nama perusahaan", "pelanggan", "customer", "nama"],
+    "segment": ["segmen", "segment"],
+}
+# Sebutan lain untuk kolom di pertanyaan pengguna: alias -> kata pada judul kolom
+COLUMN_ALIASES = {
+    "account manager": "am",
+    "am": "am",
+    "nilai": "nilai",
+    "revenue": "revenue",
+    "pendapatan": "revenue",
+    "kontrak": "kontrak",
+    "alamat": "alamat",
+    "status": "status",
+    "segmen": "segmen",
+    "witel": "witel",
+}
+# Pertanyaan dengan kata-kata ini dianggap terbuka dan tetap diteruskan ke LLM
+OPEN_ENDED_WORDS = frozenset([
+    "analisis", "analisa", "bandingkan", "perbandingan", "mengapa", "kenapa", "rekomendasi", "saran",
+    "strategi", "jelaskan", "ringkas", "ringkasan", "prediksi", "bagaimana", "evaluasi", "tren",
+])
+COUNT_WORDS = frozenset(["berapa", "jumlah", "banyak", "hitung"])
+SUM_WORDS = frozenset(["total", "jumlah", "sum"])
+MEAN_WORDS = frozenset(["rata", "average"])
+LIST_WORDS = frozenset(["daftar", "list", "semua", "siapa"])
+ENTITY_WORDS = frozenset(["pelanggan", "customer", "perusahaan", "akun", "account"])
+# Kata lain yang boleh ada di pertanyaan lookup tertutup (selain nama, kolom, dan stopword)
+LOOKUP_FILLER_WORDS = frozenset(["data", "detail", "profil", "nomor", "nama", "segmen", "segment", "nipnas", "sama", "dengan", "per"])
+
+MAX_NGRAM = 8
+MAX_LOOKUP_ROWS = 5
+MAX_LIST_ROWS = 20
+NUMERIC_MIN_RATIO = 0.8
+# Skor minimum kecocokan nama fuzzy agar lookup tetap dijawab tanpa LLM
+MIN_FUZZY_LOOKUP_SCORE = 0.7
+MIN_FUZZY_LOOKUP_MARGIN = 0.1
+
+
+def _nipnas_key(value):
+    text = str(value).strip()
+    if text.endswith(".0"):
+        text = text[:-2]  # NIPNAS yang terbaca Excel sebagai float
+    return re.sub(r"\D", "", text)
+
+
+def _find_column(columns, keywords):
+    lowered = {column: " ".join(tokenize(column)) for column in columns}
+    for keyword in keywords:
+        for column, header in lowered.items():
+            if keyword in header:
+                return column
+    return None
+
+
+def _to_numeric(values):
+    """Mengubah kolom menjadi angka; teks seperti "Rp 1.250.000" ikut dibaca. None jika kolom bukan angka."""
+    present = values[~values.map(is_empty)]
+    if present.empty:
+        return None
+    numbers = pd.to_numeric(present, errors="coerce")
+    if numbers.notna().mean() < NUMERIC_MIN_RATIO and not pd.api.types.is_numeric_dtype(present):
+        # Format Rupiah: titik sebagai pemisah ribuan dan koma sebagai desimal
+        text = present[numbers.isna()].astype(str)
+        cleaned = text.str.replace(r"(?i)rp|\s", "", regex=True).str.replace(".", "", regex=False)
+        numbers = numbers.fillna(pd.to_numeric(cleaned.str.replace(",", ".", regex=False), errors="coerce"))
+    if numbers.notna().mean() < NUMERIC_MIN_RATIO:
+        return None
+    return numbers.reindex(values.index)
+
+
+def format_number(value):
+    if float(value).is_integer():
+        return f"{int(value):,}".replace(",", ".")
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class StructuredResult:
+    """Jawaban jalur cepat sebelum diformat, agar agregat dari beberapa sumber bisa digabung.
+
+    `kind` salah satu dari "lookup" (teks sudah jadi di `text`), "count", "aggregate"
+    (`totals`: kolom -> [jumlah nilai, banyak nilai]), atau "list" (`names`).
+    """
+
+    def __init__(self, kind, label=None, count=0, totals=None, mean=False, names=None, text=None):
+        self.kind = kind
+        self.label = label
+        self.count = count
+        self.totals = totals or {}
+        self.mean = mean
+        self.names = names or []
+        self.text = text
+
+    def format(self):
+        if self.kind == "lookup":
+            return self.text
+        if self.kind == "count":
+            return f"Jumlah pelanggan di segmen **{self.label}**: **{self.count}**."
+        if self.kind == "aggregate":
+            lines = [f"Segmen **{self.label}** ({self.count} pelanggan):"]
+            for column, (total, n) in self.totals.items():
+                if self.mean:
+                    lines.append(f"- Rata-rata {column}: {format_number(total / n if n else 0)}")
+                else:
+                    lines.append(f"- Total {column}: {format_number(total)}")
+            return "\n".join(lines)
+        lines = [f"Pelanggan di segmen **{self.label}** ({len(self.names)}):"]
+        lines += [f"{number}. {name}" for number, name in enumerate(self.names[:MAX_LIST_ROWS], start=1)]
+        if len(self.names) > MAX_LIST_ROWS:
+            lines.append(f"... dan {len(self.names) - MAX_LIST_ROWS} pelanggan lainnya.")
+        return "\n".join(lines)
+
+
+def merge_structured_results(results):
+    """Menggabungkan hasil sejenis dari beberapa sumber: jumlah dan total dijumlahkan, rata-rata
+    dihitung ulang dari gabungan total dan banyak nilai, daftar nama disatukan."""
+    merged = StructuredResult(results[0].kind, mean=results[0].mean)
+    merged.label = ", ".join(dict.fromkeys(result.label for result in results))
+    for result in results:
+        merged.count += result.count
+        for column, (total, n) in result.totals.items():
+            current = merged.totals.setdefault(column, [0, 0])
+            current[0] += total
+            current[1] += n
+        merged.names += result.names
+    merged.names = list(dict.fromkeys(merged.names))
+    return merged
+
+
+class StructuredIndex:
+    """Indeks nama pelanggan, NIPNAS, dan segmen untuk menjawab lookup/agregat tanpa LLM."""
+
+    def __init__(self, df, name_index=None):
+        self.df = df
+        self.name_index = name_index
+        self.columns = {role: _find_column(df.columns, keywords) for role, keywords in ROLE_KEYWORDS.items()}
+        self.by_name = self._build_lookup(self.columns["name"], normalize_name)
+        self.by_nipnas = self._build_lookup(self.columns["nipnas"], _nipnas_key)
+        self.by_segment = self._build_lookup(self.columns["segment"], lambda value: tuple(tokenize(value)))
+        self.numeric = {}
+        for column in df.columns:
+            if column == self.columns["nipnas"]:
+                continue
+            numbers = _to_numeric(df[column])
+            if numbers is not None:
+                self.numeric[column] = numbers
+        self.headers = {column: " ".join(tokenize(column)) for column in df.columns}
+
+    def __getstate__(self):
+        # DataFrame disimpan terpisah sebagai snapshot kolumnar; dipasang lagi lewat `attach`
+        state = dict(self.__dict__)
+        state["df"] = None
+        return state
+
+    def attach(self, df):
+        self.df = df
+        return self
+
+    def _build_lookup(self, column, key_func):
+        lookup = defaultdict(list)
+        if column is None:
+            return {}
+        for row_id, value in enumerate(self.df[column]):
+            if is_empty(value):
+                continue
+            key = key_func(value)
+            if key:
+                lookup[key].append(row_id)
+        return dict(lookup)
+
+    def _match_ngrams(self, tokens, lookup):
+        """Mencari nilai di `lookup` yang muncul sebagai n-gram di pertanyaan, mengutamakan yang terpanjang."""
+        matches = []
+        for size in range(min(MAX_NGRAM, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                key = tuple(tokens[start:start + size])
+                if key in lookup and not (size == 1 and (key[0] in STOPWORDS or len(key[0]) < 3)):
+                    matches.append(key)
+            if matches:
+                return matches
+        return matches
+
+    def mentioned_columns(self, tokens):
+        """Kolom yang disebut di pertanyaan, baik dengan judul lengkap maupun aliasnya."""
+        text = f" {' '.join(tokens)} "
+        words = {COLUMN_ALIASES[alias] for alias in COLUMN_ALIASES if f" {alias} " in text}
+        mentioned = []
+        for column, header in self.headers.items():
+            header_words = set(header.split())
+            if (header and f" {header} " in text) or header_words & words:
+                mentioned.append(column)
+        return mentioned
+
+    def _customer_rows(self, tokens):
+        """Baris pelanggan yang disebut (lewat NIPNAS atau nama) beserta token yang terpakai."""
+        for token in tokens:
+            if token.isdigit() and len(token) >= 4 and token in self.by_nipnas:
+                return self.by_nipnas[token], {token}
+        name_tokens = [token for token in tokens if token not in LEGAL_SUFFIXES]
+        matches = self._match_ngrams(name_tokens, self.by_name)
+        if matches:
+            rows = sorted({row_id for key in matches for row_id in self.by_name[key]})
+            return rows, {token for key in matches for token in key}
+        if self.name_index is not None:
+            # Nama dengan salah ketik atau singkatan; hanya kecocokan kuat yang dijawab langsung
+            fuzzy = [
+                match for match in self.name_index.search(" ".join(name_tokens))
+                if match.column == self.columns["name"]
+            ]
+            if fuzzy and fuzzy[0].score >= MIN_FUZZY_LOOKUP_SCORE and (
+                len(fuzzy) == 1 or fuzzy[0].score - fuzzy[1].score >= MIN_FUZZY_LOOKUP_MARGIN
+            ):
+                return sorted(fuzzy[0].rows), set(fuzzy[0].query_tokens)
+        return [], set()
+
+    def _segment_rows(self, tokens):
+        matches = self._match_ngrams(tokens, self.by_segment)
+        if not matches:
+            return None, None, set()
+        rows = sorted({row_id for key in matches for row_id in self.by_segment[key]})
+        label = ", ".join(str(self.df[self.columns["segment"]].iloc[self.by_segment[key][0]]) for key in matches)
+        return rows, label, {token for key in matches for token in key}
+
+    def _is_closed_question(self, words, entity_tokens, mentioned):
+        """True jika semua kata di pertanyaan sudah dikenali, sehingga tidak ada maksud lain yang terlewat."""
+        known = set(entity_tokens) | STOPWORDS | LEGAL_SUFFIXES | LOOKUP_FILLER_WORDS | ENTITY_WORDS
+        known |= COUNT_WORDS | SUM_WORDS | MEAN_WORDS | LIST_WORDS
+        known |= {word for alias in COLUMN_ALIASES for word in alias.split()}
+        for column in mentioned:
+            known |= set(self.headers[column].split())
+        return not (words - known)
+
+    def answer(self, prompt):
+        """Jawaban langsung untuk `prompt`, atau None jika pertanyaan perlu diteruskan ke LLM."""
+        result = self.resolve(prompt)
+        return result.format() if result is not None else None
+
+    def resolve(self, prompt):
+        """StructuredResult untuk `prompt`, atau None jika pertanyaan perlu diteruskan ke LLM."""
+        tokens = tokenize(prompt)
+        words = set(tokens)
+        if not tokens or words & OPEN_ENDED_WORDS:
+            return None
+        mentioned = [column for column in self.mentioned_columns(tokens) if column not in self.columns.values()]
+
+        customer_rows, customer_tokens = self._customer_rows(tokens)
+        if customer_rows:
+            if not self._is_closed_question(words, customer_tokens, mentioned):
+                return None
+            return StructuredResult("lookup", text=self._format_lookup(customer_rows, mentioned))
+
+        segment_rows, segment_label, segment_tokens = self._segment_rows(tokens)
+        if segment_rows is None or not self._is_closed_question(words, segment_tokens, mentioned):
+            return None
+        numeric_mentioned = [column for column in mentioned if column in self.numeric]
+        if numeric_mentioned and words & (SUM_WORDS | MEAN_WORDS | {"berapa"}):
+            totals = {}
+            for column in numeric_mentioned:
+                values = self.numeric[column].iloc[segment_rows].dropna()
+                totals[column] = [values.sum(), len(values)]
+            return StructuredResult(
+                "aggregate", segment_label, len(segment_rows), totals, mean=bool(words & MEAN_WORDS)
+            )
+        if words & COUNT_WORDS and words & ENTITY_WORDS:
+            return StructuredResult("count", segment_label, len(segment_rows))
+        if words & LIST_WORDS and self.columns["name"] is not None:
+            names = self.df[self.columns["name"]].iloc[segment_rows]
+            names = list(dict.fromkeys(str(name) for name in names if not is_empty(name)))
+            return StructuredResult("list", segment_label, names=names)
+        return None
+
+    def _row_label(self, row):
+        label = str(row[self.columns["name"]]) if self.columns["name"] is not None else "Pelanggan"
+        if self.columns["nipnas"] is not None and not is_empty(row[self.columns["nipnas"]]):
+            label += f" (NIPNAS {_nipnas_key(row[self.columns['nipnas']])})"
+        return label
+
+    def _format_lookup(self, row_ids, columns):
+        rows = self.df.iloc[row_ids[:MAX_LOOKUP_ROWS]]
+        columns = columns or [column for column in self.df.columns if column not in self.columns.values()]
+        blocks = []
+        for _, row in rows.iterrows():
+            lines = [f"**{self._row_label(row)}**"]
+            for column in columns:
+                value = row[column]
+                lines.append(f"- {column}: {'-' if is_empty(value) else ' '.join(str(value).split())}")
+            blocks.append("\n".join(lines))
+        reply = "\n\n".join(blocks)
+        if len(row_ids) > MAX_LOOKUP_ROWS:
+            reply += f"\n\n({len(row_ids) - MAX_LOOKUP_ROWS} baris lain yang cocok tidak ditampilkan.)"
+        return reply
+
+
+def build_structured_index(df, name_index=None):
+    """Membangun indeks jalur cepat; None jika database tidak dimuat."""
+    if df is None or df.empty:
+        return None
+    return StructuredIndex(df, name_index)
+
+
+def resolve_structured_query(prompt, structured_index):
+    """StructuredResult untuk `prompt` dari satu database; None berarti pertanyaan perlu LLM."""
+    if structured_index is None:
+        return None
+    try:
+        result = structured_index.resolve(prompt)
+    except Exception as e:
+        logger.error(f"Error pada jalur cepat kueri terstruktur: {e}")
+        return None
+    if result is not None:
+        logger.info(f"Pertanyaan dijawab langsung dari database tanpa LLM: {prompt}")
+    return result
+
+
+def answer_structured_query(prompt, structured_index):
+    """Mencoba menjawab `prompt` langsung dari database; None berarti pertanyaan perlu LLM."""
+    result = resolve_structured_query(prompt, structured_index)
+    return result.format() if result is not None else None
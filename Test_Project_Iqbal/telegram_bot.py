@@ -1,24 +1,32 @@
 # Impor pustaka yang diperlukan
 import os
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import pandas as pd
-import tabulate
-from openai import OpenAI
-import google.generativeai as genai
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
-    ConversationHandler,
+    TypeHandler,
 )
-# NEW: Impor untuk menangani file Word dan file di memori
-import docx
+# NEW: Impor untuk menangani file di memori
 from io import BytesIO
 
+from admission import MAX_CONCURRENT_LLM_CALLS, AdmissionRejected, get_admission_controller
+from bot_persistence import SharedConversationHandler, SharedStatePersistence, open_state_store, save_state_after_update
+from data_sources import get_data_sources
+from context_packer import question_with_context
+from metrics import start_trace
+from provider_router import ProvidersThrottled, get_router
+from sph_jobs import get_sph_queue, read_batch_file
+from response_cache import get_response_cache
+
 # Muat variabel lingkungan dari file .env
 load_dotenv()
 
@@ -37,7 +45,7 @@ Aturan Anda:
 - Jika data tidak ditemukan dalam database, Anda harus menyatakan: "Maaf, data yang Anda cari tidak ditemukan dalam database."
 - Jangan mengarang informasi atau menjawab pertanyaan di luar lingkup data yang disediakan.
 
-Berikut adalah data pelanggan yang relevan untuk permintaan pengguna:
+Data pelanggan yang relevan untuk setiap permintaan disertakan bersama pertanyaan pengguna.
 """
 
 ASKARINA_RESEARCH_PROMPT = """Anda adalah ASKARINA, seorang Asisten Riset B2B industri telekomunikasi. Peran Anda adalah untuk menjawab pertanyaan pengetahuan umum dan melakukan pencarian di internet untuk menemukan informasi, seperti analisis pasar, profil perusahaan, atau tren industri untuk mencari prospek pelanggan baru di sektor pelayanan digital dan Telekomunikasi.
@@ -47,62 +55,155 @@ ASKARINA_RESEARCH_PROMPT = """Anda adalah ASKARINA, seorang Asisten Riset B2B in
 
 SPREADSHEET_URL = "Input Your URL"
 
-# --- Fungsi ---
-def load_database_as_df(url):
-    try:
-        df = pd.read_excel(url, engine="openpyxl")
-        logger.info("Database berhasil dimuat ke dalam DataFrame.")
-        return df
-    except Exception as e:
-        logger.error(f"Error memuat spreadsheet: {e}")
-        return None
-
-def find_relevant_context(prompt, df):
-    if df is None or df.empty:
-        return "Database tidak dimuat atau kosong."
-    prompt_keywords = set(prompt.lower().split())
-    df_searchable = df.astype(str).apply(lambda x: ' '.join(x).lower(), axis=1)
-    mask = df_searchable.str.contains('|'.join(prompt_keywords), na=False)
-    relevant_df = df[mask]
-    if relevant_df.empty:
-        return "Tidak ada data spesifik yang ditemukan untuk permintaan Anda di database."
-    return tabulate.tabulate(relevant_df, headers="keys", tablefmt="github", showindex=False)
-
-def generate_sph_text(data):
-    prompt = f"""
-    Berdasarkan informasi berikut, buat draf dokumen SPH (Surat Penawaran Harga) yang profesional dalam Bahasa Indonesia.
-    - Nama Pelanggan: {data['customer_name']}
-    - Alamat Pelanggan: {data['customer_address']}
-    - Produk/Layanan: {data['product']}
-    - Harga: {data['price']}
-    - Catatan Tambahan: {data['notes']}
-    Dokumen harus memiliki header yang jelas, pendahuluan, detail penawaran, harga, syarat dan ketentuan, serta penutup.
+# --- Kontrol Penerimaan Panggilan LLM ---
+# Batas laju per pengguna, slot bersamaan, dan antrean prioritas per proses (lihat admission.py)
+ADMISSION = get_admission_controller()
+
+@asynccontextmanager
+async def llm_slot(user_id, trace=None, reply=None):
+    """Menunggu slot panggilan LLM dari admission controller.
+
+    Selama antre, placeholder `reply` diperbarui dengan posisi antrean. Jika `trace` diberikan,
+    lama menunggu slot dicatat sebagai tahap "slot_wait". Melempar AdmissionRejected bila ditolak.
     """
-    try:
-        response = GEMINI_CLIENT.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        logger.error(f"Error saat membuat SPH: {e}")
-        return "Maaf, terjadi kesalahan saat membuat draf SPH."
+    async def on_queued(position):
+        if trace is not None:
+            trace.set(queue_position=position)
+        if reply is not None:
+            await reply.status(f"⏳ Permintaan Anda dalam antrean, posisi {position}.")
+
+    started = time.monotonic()
+    async with ADMISSION.aacquire(user_id, on_queued=on_queued):
+        if trace is not None:
+            trace.add_stage("slot_wait", time.monotonic() - started)
+        yield
+
+# --- Balasan Streaming ---
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+# Jeda minimum antar edit pesan agar tidak terkena batas laju Telegram
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+STREAM_CURSOR = "▌"
+
+def split_message(text, limit=TELEGRAM_MAX_MESSAGE_LENGTH):
+    """Memecah teks panjang menjadi beberapa bagian <= limit, sebisa mungkin di batas baris."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+# Pengganti placeholder bila penyedia selesai tanpa mengirim teks apa pun
+EMPTY_ANSWER_MESSAGE = "Maaf, ASKARINA tidak menghasilkan jawaban untuk pertanyaan ini. Silakan coba ulangi dengan kalimat lain."
+
+class StreamingReply:
+    """Mengirim placeholder lalu mengedit pesan secara berkala selama potongan jawaban datang."""
+
+    def __init__(self, message):
+        self.message = message
+        self.text = ""
+        self.sent_messages = []
+        self.sent_texts = []
+        self._last_edit = 0.0
+
+    async def start(self):
+        placeholder = await self.message.reply_text("⏳ ASKARINA sedang menyusun jawaban...")
+        self.sent_messages.append(placeholder)
+        self.sent_texts.append(placeholder.text)
+        self._last_edit = time.monotonic()
+
+    async def status(self, text):
+        """Mengganti teks placeholder (mis. posisi antrean) selama jawaban belum mulai mengalir."""
+        if self.text or not self.sent_messages or self.sent_texts[0] == text:
+            return
+        if await self._send(self.sent_messages[0].edit_text, text, final=False):
+            self.sent_texts[0] = text
+
+    async def append(self, chunk):
+        if not chunk:
+            return
+        self.text += chunk
+        if time.monotonic() - self._last_edit >= STREAM_EDIT_INTERVAL:
+            await self._flush(final=False)
+
+    async def finish(self, text=None):
+        if text is not None:
+            self.text = text
+        await self._flush(final=True)
+
+    async def fail(self, text):
+        """`finish` untuk blok except: error Telegram saat menampilkan pesan gagal hanya dicatat."""
+        try:
+            await self.finish(text)
+        except TelegramError as e:
+            logger.warning(f"Gagal menampilkan pesan error ke pengguna: {e}")
+
+    async def _flush(self, final):
+        self._last_edit = time.monotonic()
+        display = self.text if final else self.text + STREAM_CURSOR
+        if not display.strip():
+            if not final:
+                return
+            # Stream kosong: placeholder "sedang menyusun" tidak boleh tertinggal selamanya
+            display = EMPTY_ANSWER_MESSAGE
+        for i, part in enumerate(split_message(display)):
+            if i < len(self.sent_messages):
+                if self.sent_texts[i] == part:
+                    continue
+                if not await self._send(self.sent_messages[i].edit_text, part, final):
+                    return
+            else:
+                new_message = await self._send(self.message.reply_text, part, final)
+                if not new_message:
+                    return
+                self.sent_messages.append(new_message)
+            self.sent_texts[i:i + 1] = [part]
+
+    async def _send(self, method, text, final):
+        """Memanggil edit/kirim; update sementara dilewati saat kena batas laju, update akhir diulang."""
+        while True:
+            try:
+                return await method(text)
+            except RetryAfter as e:
+                if not final:
+                    return None
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return True
+                raise
 
 # --- Variabel global dan Klien API ---
-TELKOM_API_KEY = os.getenv("TELKOM_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Mis. "http://127.0.0.1:8081" untuk server palsu di fake_telegram.py; kosong = api.telegram.org
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "").rstrip("/")
+
+# --- Mode Webhook ---
+# URL publik yang didaftarkan ke Telegram; kosong = mode polling (satu proses saja)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_LISTEN = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+# Setiap worker mendengarkan di port sendiri di belakang load balancer yang meneruskan ke URL di atas
+TELEGRAM_WEBHOOK_PORT = int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443"))
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "telegram")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
 
-TELKOM_CLIENT = OpenAI(api_key=TELKOM_API_KEY, base_url="https://telkom-ai-dag-api.apilogy.id/Telkom-LLM/0.0.4/", default_headers={"x-api-key": TELKOM_API_KEY})
-genai.configure(api_key=GEMINI_API_KEY)
-GEMINI_CLIENT = genai.GenerativeModel('gemini-1.5-flash')
-DATABASE_DF = load_database_as_df(SPREADSHEET_URL)
+# Setiap sumber database dimuat saat pertama kali dibutuhkan lalu diperbarui otomatis di latar belakang
+DATA_SOURCES = get_data_sources(SPREADSHEET_URL)
+RESPONSE_CACHE = get_response_cache()
+ROUTER = get_router()
+SPH_QUEUE = get_sph_queue()
 
 # --- State untuk ConversationHandler ---
-MAIN_MENU, CHOOSE_MODE, SPH_CUSTOMER, SPH_ADDRESS, SPH_PRODUCT, SPH_PRICE, SPH_NOTES, HANDLE_QUERY = range(8)
+MAIN_MENU, CHOOSE_MODE, SPH_CUSTOMER, SPH_ADDRESS, SPH_PRODUCT, SPH_PRICE, SPH_NOTES, HANDLE_QUERY, SPH_BATCH = range(9)
 
 # --- Fungsi Menu dan Navigasi ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logger.info(f"Pengguna {update.effective_user.first_name} memulai percakapan.")
     context.user_data.clear()
-    keyboard = [["Pilih Mode", "Buat SPH"]]
+    keyboard = [["Pilih Mode", "Buat SPH"], ["Buat SPH Massal"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
     await update.message.reply_text(
         "Halo! Saya ASKARINA, Asisten Kawal B2B Anda. Silakan pilih opsi dari menu di bawah:",
@@ -123,6 +224,14 @@ async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await update.message.reply_text("Baik, mari kita mulai membuat SPH. Siapa nama pelanggannya?", reply_markup=reply_markup)
         return SPH_CUSTOMER
+    elif user_choice == "Buat SPH Massal":
+        keyboard = [["Batal"]]
+        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        await update.message.reply_text(
+            "Kirim file CSV/XLSX dengan kolom: pelanggan, alamat, produk, harga, catatan (opsional).",
+            reply_markup=reply_markup,
+        )
+        return SPH_BATCH
     else:
         return await start(update, context)
 
@@ -142,30 +251,99 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     mode = context.user_data.get('mode')
     prompt = update.message.text
     logger.info(f"Menerima pesan dari {update.effective_user.first_name} dalam mode {mode}: {prompt}")
+    trace = start_trace("chat", "internal" if mode == "Data Internal" else "riset", "telegram")
+    status = "ok"
+    route_info = {}
 
     if mode == "Data Internal":
-        if DATABASE_DF is None:
+        # Sumber yang belum pernah dimuat dibaca di thread pool agar event loop tetap bebas
+        with trace.stage("data_load"):
+            view = await asyncio.to_thread(DATA_SOURCES.select, prompt)
+        trace.set(sources=[spec.name for spec, _ in view.snapshots])
+        with trace.stage("structured_query"):
+            direct = view.answer_structured(prompt) if view.available else None
+        if not view.available:
             await update.message.reply_text("Maaf, database tidak dapat diakses saat ini.")
+            status = "unavailable"
+        elif direct:
+            # Lookup/agregat sederhana dijawab langsung dari database tanpa memanggil LLM
+            for part in split_message(direct.replace("**", "")):
+                await update.message.reply_text(part)
+            status = "structured"
+        # Cache semantik meng-encode prompt dengan embedder, jadi dijalankan di thread pool
+        elif cached := await asyncio.to_thread(RESPONSE_CACHE.get, prompt, "internal", "telkom-ai", view.version):
+            for part in split_message(cached):
+                await update.message.reply_text(part)
+            status = "cache_hit"
         else:
-            relevant_knowledge = find_relevant_context(prompt, DATABASE_DF)
-            final_system_prompt = ASKARINA_INTERNAL_PROMPT + "\n" + relevant_knowledge
-            api_messages = [{"role": "system", "content": final_system_prompt}, {"role": "user", "content": prompt}]
+            # Pencarian konteks memakai CPU, jadi dijalankan di thread pool agar event loop tetap bebas
+            with trace.stage("context_search"):
+                relevant_knowledge = await asyncio.to_thread(view.relevant_context, prompt, "telkom-ai")
+            # Prompt sistem statis selalu di depan dan tidak berubah agar bisa di-cache penyedia
+            api_messages = [
+                {"role": "system", "content": ASKARINA_INTERNAL_PROMPT},
+                {"role": "user", "content": question_with_context(prompt, relevant_knowledge)},
+            ]
+            trace.prompt(api_messages)
+            reply = StreamingReply(update.message)
+            await reply.start()
             try:
-                response = TELKOM_CLIENT.chat.completions.create(model="telkom-ai", messages=api_messages)
-                await update.message.reply_text(response.choices[0].message.content)
+                async with llm_slot(update.effective_user.id, trace, reply):
+                    with trace.stage("generation"):
+                        async for text in ROUTER.astream("internal", api_messages, route_info):
+                            await reply.append(text)
+                await reply.finish()
+                if reply.text.strip():
+                    await asyncio.to_thread(RESPONSE_CACHE.set, prompt, "internal", "telkom-ai", reply.text, view.version)
+            except (AdmissionRejected, ProvidersThrottled) as e:
+                # Ditolak sebelum sampai ke penyedia: pengguna diberi tahu kapan bisa mencoba lagi
+                logger.info(f"Permintaan internal dari {update.effective_user.id} ditolak: {e}")
+                await reply.fail(str(e))
+                status = "shed"
             except Exception as e:
-                logger.error(f"Error memanggil Telkom API: {e}")
-                await update.message.reply_text("Maaf, terjadi kesalahan saat menghubungi layanan internal.")
+                logger.error(f"Error memanggil layanan LLM (internal): {e}")
+                await reply.fail("Maaf, terjadi kesalahan saat menghubungi layanan internal.")
+                status = "error"
+            trace.routed(route_info)
+            trace.finish(status, reply.text)
+            return await start(update, context)
     
     elif mode == "Riset Prospek & Umum":
-        final_prompt = ASKARINA_RESEARCH_PROMPT + "\n\nPertanyaan Pengguna: " + prompt
+        cached = await asyncio.to_thread(RESPONSE_CACHE.get, prompt, "riset", "gemini")
+        if cached:
+            for part in split_message(cached):
+                await update.message.reply_text(part)
+            trace.finish("cache_hit", cached)
+            return await start(update, context)
+        api_messages = [
+            {"role": "system", "content": ASKARINA_RESEARCH_PROMPT},
+            {"role": "user", "content": "Pertanyaan Pengguna: " + prompt},
+        ]
+        trace.prompt(api_messages)
+        reply = StreamingReply(update.message)
+        await reply.start()
         try:
-            response = GEMINI_CLIENT.generate_content(final_prompt)
-            await update.message.reply_text(response.text)
+            async with llm_slot(update.effective_user.id, trace, reply):
+                with trace.stage("generation"):
+                    async for text in ROUTER.astream("riset", api_messages, route_info):
+                        await reply.append(text)
+            await reply.finish()
+            if reply.text.strip():
+                await asyncio.to_thread(RESPONSE_CACHE.set, prompt, "riset", "gemini", reply.text)
+        except (AdmissionRejected, ProvidersThrottled) as e:
+            # Ditolak sebelum sampai ke penyedia: pengguna diberi tahu kapan bisa mencoba lagi
+            logger.info(f"Permintaan riset dari {update.effective_user.id} ditolak: {e}")
+            await reply.fail(str(e))
+            status = "shed"
         except Exception as e:
-            logger.error(f"Error memanggil Gemini API: {e}")
-            await update.message.reply_text("Maaf, terjadi kesalahan saat melakukan riset.")
+            logger.error(f"Error memanggil layanan LLM (riset): {e}")
+            await reply.fail("Maaf, terjadi kesalahan saat melakukan riset.")
+            status = "error"
+        trace.routed(route_info)
+        trace.finish(status, reply.text)
+        return await start(update, context)
     
+    trace.finish(status)
     return await start(update, context)
 
 # --- Fungsi Penangan Generator SPH ---
@@ -194,35 +372,55 @@ async def sph_get_notes_and_generate(update: Update, context: ContextTypes.DEFAU
     await update.message.reply_text("Terima kasih. Saya sedang membuat draf SPH...", reply_markup=ReplyKeyboardRemove())
     
     sph_data = context.user_data['sph']
-    sph_text = generate_sph_text(sph_data)
-    
-    # --- REVISED: Membuat dan mengirim file Word ---
-    try:
-        # Membuat dokumen Word di memori
-        document = docx.Document()
-        document.add_paragraph(sph_text)
-        
-        # Menyimpan dokumen ke buffer BytesIO
-        doc_io = BytesIO()
-        document.save(doc_io)
-        doc_io.seek(0) # Kembali ke awal file
-        
-        # Membuat nama file yang dinamis
-        customer_name = sph_data.get('customer_name', 'customer').replace(' ', '_')
-        file_name = f"SPH_{customer_name}.docx"
-        
-        # Mengirim dokumen ke pengguna
-        await update.message.reply_document(document=doc_io, filename=file_name)
-        logger.info(f"File SPH '{file_name}' berhasil dikirim.")
+    # SPH dibuat oleh worker pool antrean SPH; handler hanya menunggu hasilnya
+    job = SPH_QUEUE.submit(sph_data)
+    await asyncio.wrap_future(job.future)
 
-    except Exception as e:
-        logger.error(f"Gagal membuat atau mengirim file docx: {e}")
-        await update.message.reply_text("Maaf, terjadi kesalahan saat membuat file Word. Berikut adalah draf dalam bentuk teks:")
-        await update.message.reply_text(sph_text) # Fallback ke teks biasa jika gagal
+    if job.status == "failed":
+        await update.message.reply_text("Maaf, terjadi kesalahan saat membuat draf SPH.")
+    else:
+        # --- REVISED: Mengirim file Word yang dibuat oleh worker ---
+        try:
+            file_name = next(name for name in job.files if name.endswith(".docx"))
+            await update.message.reply_document(document=BytesIO(job.files[file_name]), filename=file_name)
+            logger.info(f"File SPH '{file_name}' berhasil dikirim.")
+        except Exception as e:
+            logger.error(f"Gagal mengirim file docx: {e}")
+            await update.message.reply_text("Maaf, terjadi kesalahan saat mengirim file Word. Berikut adalah draf dalam bentuk teks:")
+            for part in split_message(job.text):
+                await update.message.reply_text(part) # Fallback ke teks biasa jika gagal
     
     context.user_data.pop('sph', None)
     return await start(update, context)
 
+async def sph_batch_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    document = update.message.document
+    try:
+        telegram_file = await document.get_file()
+        file_bytes = bytes(await telegram_file.download_as_bytearray())
+        rows = await asyncio.to_thread(read_batch_file, file_bytes, document.file_name or "batch.xlsx")
+    except Exception as e:
+        logger.error(f"Gagal membaca file batch SPH: {e}")
+        await update.message.reply_text(f"Maaf, file tidak dapat dibaca: {e}")
+        return SPH_BATCH
+    if not rows:
+        await update.message.reply_text("Tidak ada baris lengkap di file tersebut.")
+        return SPH_BATCH
+
+    await update.message.reply_text(f"Membuat {len(rows)} draf SPH...", reply_markup=ReplyKeyboardRemove())
+    batch_id = SPH_QUEUE.submit_batch(rows)
+    jobs = SPH_QUEUE.batch_jobs(batch_id)
+    await asyncio.gather(*(asyncio.wrap_future(job.future) for job in jobs))
+
+    failed = [job.data["customer_name"] for job in jobs if job.status == "failed"]
+    archive = await asyncio.to_thread(SPH_QUEUE.batch_zip, batch_id)
+    SPH_QUEUE.discard_batch(batch_id)
+    await update.message.reply_document(document=BytesIO(archive), filename="SPH_batch.zip")
+    if failed:
+        await update.message.reply_text(f"{len(failed)} SPH gagal dibuat: {', '.join(failed)}")
+    logger.info(f"Batch SPH selesai: {len(jobs) - len(failed)} berhasil, {len(failed)} gagal.")
+    return await start(update, context)
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logger.info("Pengguna membatalkan operasi.")
     context.user_data.clear()
@@ -230,17 +428,24 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return await start(update, context)
 
 # --- Fungsi Utama ---
-def main() -> None:
-    if not TELEGRAM_BOT_TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN tidak ditemukan di file .env!")
-        return
-
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+def build_application(token=TELEGRAM_BOT_TOKEN, store=None, api_base_url=TELEGRAM_API_BASE_URL) -> Application:
+    """Application dengan semua handler ASKARINA; `store` default dibuka dari TELEGRAM_STATE_URL."""
+    # Update diproses bersamaan sehingga satu pengguna yang menunggu LLM tidak menahan pengguna lain.
+    # State percakapan dan user_data disimpan di store bersama agar beberapa worker bisa melayani pengguna yang sama.
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(MAX_CONCURRENT_LLM_CALLS * 4)
+        .persistence(SharedStatePersistence(store or open_state_store()))
+    )
+    if api_base_url:
+        builder = builder.base_url(f"{api_base_url}/bot").base_file_url(f"{api_base_url}/file/bot")
+    application = builder.build()
 
-    conv_handler = ConversationHandler(
+    conv_handler = SharedConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
-            MAIN_MENU: [MessageHandler(filters.Regex(r'^(Pilih Mode|Buat SPH)$'), main_menu_handler)],
+            MAIN_MENU: [MessageHandler(filters.Regex(r'^(Pilih Mode|Buat SPH|Buat SPH Massal)$'), main_menu_handler)],
             CHOOSE_MODE: [
                 MessageHandler(filters.Regex(r'^(Data Internal|Riset Prospek & Umum)$'), set_mode_and_prompt),
                 MessageHandler(filters.Regex(r'^Kembali ke Menu Utama$'), back_to_main_menu),
@@ -251,17 +456,39 @@ def main() -> None:
             SPH_PRODUCT: [MessageHandler(filters.TEXT & ~filters.COMMAND, sph_get_product)],
             SPH_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, sph_get_price)],
             SPH_NOTES: [MessageHandler(filters.TEXT & ~filters.COMMAND, sph_get_notes_and_generate)],
+            SPH_BATCH: [MessageHandler(filters.Document.ALL, sph_batch_generate)],
         },
         fallbacks=[
             CommandHandler("start", start),
             MessageHandler(filters.Regex(r'^(Batal|Kembali ke Menu Utama)$'), cancel)
         ],
+        name="askarina",
     )
 
     application.add_handler(conv_handler)
-    
-    logger.info("Bot sedang berjalan...")
-    application.run_polling()
+    # Grup terpisah agar dijalankan setelah ConversationHandler selesai memproses update
+    application.add_handler(TypeHandler(Update, save_state_after_update), group=1)
+    return application
+
+def main() -> None:
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN tidak ditemukan di file .env!")
+        return
+    application = build_application()
+
+    if TELEGRAM_WEBHOOK_URL:
+        # Butuh python-telegram-bot[webhooks]; setWebhook dari beberapa worker dengan URL yang sama aman diulang
+        logger.info(f"Bot berjalan dalam mode webhook di {TELEGRAM_WEBHOOK_LISTEN}:{TELEGRAM_WEBHOOK_PORT}/{TELEGRAM_WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=TELEGRAM_WEBHOOK_LISTEN,
+            port=TELEGRAM_WEBHOOK_PORT,
+            url_path=TELEGRAM_WEBHOOK_PATH,
+            webhook_url=TELEGRAM_WEBHOOK_URL,
+            secret_token=TELEGRAM_WEBHOOK_SECRET or None,
+        )
+    else:
+        logger.info("Bot sedang berjalan...")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
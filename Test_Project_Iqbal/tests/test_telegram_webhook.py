@@ -0,0 +1,77 @@
+# Dua worker webhook dalam satu proses berbagi satu store SQLite; percakapan SPH dikirim bergantian ke keduanya
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("tornado")
+
+from bot_persistence import SqliteStateStore
+from fake_telegram import make_update, post_update, start_fake_telegram
+
+SPH_MESSAGES = ["/start", "Buat SPH", "PT Maju Jaya", "Jl. Sudirman 1", "Astinet 100 Mbps", "Rp 5.000.000", "-"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sent_texts(calls):
+    return [params.get("text", "") for method, params in calls if method.lower() in ("sendmessage", "editmessagetext")]
+
+
+async def run_conversation(state_path, api_base_url, fake_state):
+    import telegram_bot
+
+    workers = []
+    for _ in range(2):
+        application = telegram_bot.build_application("123:test", SqliteStateStore(state_path), api_base_url)
+        port = free_port()
+        webhook_url = f"http://127.0.0.1:{port}/telegram"
+        await application.initialize()
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=port, url_path="telegram", webhook_url=webhook_url
+        )
+        await application.start()
+        workers.append((application, webhook_url))
+
+    replies = []
+    try:
+        for update_id, text in enumerate(SPH_MESSAGES, start=1):
+            # Pesan ganjil ke worker pertama, genap ke worker kedua
+            _, webhook_url = workers[update_id % 2]
+            start = len(fake_state.calls)
+            await asyncio.to_thread(post_update, webhook_url, make_update(update_id, text))
+            calls = await asyncio.to_thread(fake_state.wait_for_calls, start, 0.5, 30)
+            replies.append(calls)
+    finally:
+        for application, _ in workers:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+    return replies
+
+
+def test_sph_conversation_across_two_webhook_workers(tmp_path, monkeypatch):
+    # Tanpa kunci Gemini paragraf penawaran memakai teks baku, jadi tidak ada panggilan jaringan keluar
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    server, fake_state = start_fake_telegram(port=0)
+    api_base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        replies = asyncio.run(run_conversation(str(tmp_path / "state.db"), api_base_url, fake_state))
+    finally:
+        server.shutdown()
+
+    assert any("pilih opsi" in text for text in sent_texts(replies[0]))
+    # Setiap langkah dijawab oleh worker yang berbeda dari langkah sebelumnya
+    assert any("nama pelanggannya" in text for text in sent_texts(replies[1]))
+    assert any("alamat lengkap" in text for text in sent_texts(replies[2]))
+    assert any("Produk/layanan" in text for text in sent_texts(replies[3]))
+    assert any("harga penawarannya" in text for text in sent_texts(replies[4]))
+    assert any("catatan tambahan" in text for text in sent_texts(replies[5]))
+    assert any(method.lower() == "senddocument" for method, _ in replies[6])
+    # Percakapan kembali ke menu utama setelah SPH terkirim
+    assert any("pilih opsi" in text for text in sent_texts(replies[6]))